@@ -0,0 +1,6 @@
+"""
+Benchmark scripts for the community project.
+
+Each script runs against a throwaway test database and is started as a module
+from the project root, e.g. ``python -m benchmarks.permission_middleware``.
+"""
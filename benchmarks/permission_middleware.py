@@ -0,0 +1,90 @@
+"""
+Benchmark the permission middleware stack on an authenticated page view.
+
+Compares the lazy permission snapshot of PermissionAuditMiddleware with the
+previous behaviour, which resolved the snapshot eagerly on every request, for
+an authenticated GET of ``community:category_list`` with a warm and a cold
+permission cache.
+
+Usage: python -m benchmarks.permission_middleware [--repeat N]
+"""
+import argparse
+
+from benchmarks.utils import measure, print_results, setup_django, test_database
+
+setup_django()
+
+from django.core.cache import caches  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from users.middleware import PermissionAuditMiddleware  # noqa: E402
+
+EAGER_MIDDLEWARE = 'benchmarks.permission_middleware.EagerSnapshotAuditMiddleware'
+# Its review marker lives in the cache, so clearing the cache for cold runs
+# would review the user's permissions on every request
+EXCLUDED_MIDDLEWARE = {'users.middleware.LeastPrivilegeMiddleware'}
+
+
+class EagerSnapshotAuditMiddleware(PermissionAuditMiddleware):
+    """Previous behaviour: resolve the permission snapshot on every request."""
+
+    def __call__(self, request):
+        if request.user.is_authenticated:
+            self._get_user_permissions(request.user)
+        return super().__call__(request)
+
+
+def middleware_settings(eager):
+    """
+    Get the MIDDLEWARE setting to benchmark, optionally with the eager audit
+    middleware swapped in.
+    """
+    from django.conf import settings
+    return [
+        EAGER_MIDDLEWARE if eager and path == 'users.middleware.PermissionAuditMiddleware' else path
+        for path in settings.MIDDLEWARE
+        if path not in EXCLUDED_MIDDLEWARE
+    ]
+
+
+def run(repeat):
+    from django.contrib.auth import get_user_model
+
+    user = get_user_model().objects.create_user(
+        username='bench', email='bench@example.com', password='benchpassword123'
+    )
+    url = reverse('community:category_list')
+
+    def clear_cache():
+        for cache in caches.all():
+            cache.clear()
+
+    results = {}
+    for label, eager in (('lazy', False), ('eager', True)):
+        with override_settings(MIDDLEWARE=middleware_settings(eager)):
+            # The client loads the middleware chain on its first request
+            client = Client()
+            client.force_login(user)
+
+            def request():
+                client.get(url)
+
+            request()  # warm up
+            results[f'{label} snapshot, warm cache'] = measure(request, repeat)
+            results[f'{label} snapshot, cold cache'] = measure(request, repeat, setup=clear_cache)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=200, help='Requests per case')
+    args = parser.parse_args()
+
+    with test_database():
+        results = run(args.repeat)
+    print_results('Authenticated GET community:category_list', results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+"""
+Micro-benchmarks for permission resolution.
+
+Builds role hierarchies of varying depth and width on top of the default
+roles created by users.signals.create_default_roles, then measures queries
+and wall time of User.get_permissions, has_permission, has_role,
+get_trust_level and the full middleware stack with a cold and a warm
+permission cache. Results are written to a JSON file; pass a previous file
+with --compare to print the change per case.
+
+Usage: python -m benchmarks.permission_resolution [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import platform
+import subprocess
+from datetime import datetime, timezone
+
+from benchmarks.utils import measure, print_results, setup_django, test_database
+
+setup_django()
+
+import django  # noqa: E402
+from django.contrib.auth import get_user_model  # noqa: E402
+from django.core.cache import caches  # noqa: E402
+from django.test import Client, override_settings  # noqa: E402
+from django.urls import reverse  # noqa: E402
+
+from users.models import UserRole, UserRoleAssignment  # noqa: E402
+
+# Its review marker lives in the cache, so clearing the cache for cold runs
+# would review the user's permissions on every request
+EXCLUDED_MIDDLEWARE = {'users.middleware.LeastPrivilegeMiddleware'}
+
+DEPTHS = (1, 5, 20)
+WIDTHS = (1, 5, 20)
+
+
+def clear_caches():
+    for cache in caches.all():
+        cache.clear()
+
+
+def build_user(depth, width):
+    """
+    Create a user holding ``width`` roles, each at the end of a chain of
+    ``depth`` roles descending from the default "Regular User" role.
+    """
+    User = get_user_model()
+    regular_user = UserRole.objects.get(name='Regular User')
+    user = User.objects.create_user(
+        username=f'bench_d{depth}_w{width}',
+        email=f'bench_d{depth}_w{width}@example.com',
+        password='benchpassword123',
+    )
+    for branch in range(width):
+        parent = regular_user
+        for level in range(depth):
+            parent = UserRole.objects.create(
+                name=f'd{depth}_w{width}_b{branch}_l{level}',
+                parent_role=parent,
+                trust_level=min(level, 5),
+            )
+        UserRoleAssignment.objects.create(user=user, role=parent)
+    return user
+
+
+def benchmark_user(user, repeat):
+    """Measure the permission methods of the user model."""
+    User = get_user_model()
+    role_name = user.get_roles()[-1].name
+    operations = {
+        'get_permissions': lambda u: u.get_permissions(),
+        'has_permission': lambda u: u.has_permission('can_edit_any_content'),
+        'has_role': lambda u: u.has_role(role_name),
+        'get_trust_level': lambda u: u.get_trust_level(),
+    }
+    current = {}
+
+    def load_user(cold):
+        def setup():
+            if cold:
+                clear_caches()
+            current['user'] = User.objects.get(pk=user.pk)
+        return setup
+
+    results = {}
+    for name, operation in operations.items():
+        for cache_state in ('cold', 'warm'):
+            setup = load_user(cache_state == 'cold')
+            if cache_state == 'warm':
+                current['user'] = User.objects.get(pk=user.pk)
+                operation(current['user'])
+            results[(name, cache_state)] = measure(lambda: operation(current['user']), repeat, setup=setup)
+    return results
+
+
+def benchmark_middleware(user, repeat):
+    """
+    Measure an authenticated request through the middleware stack, without
+    the least-privilege review.
+    """
+    from django.conf import settings
+    middleware = [path for path in settings.MIDDLEWARE if path not in EXCLUDED_MIDDLEWARE]
+    with override_settings(MIDDLEWARE=middleware):
+        # The client loads the middleware chain on its first request
+        client = Client()
+        client.force_login(user)
+        url = reverse('community:category_list')
+
+        def request():
+            client.get(url)
+
+        request()
+        return {
+            ('middleware_stack', 'cold'): measure(request, repeat, setup=clear_caches),
+            ('middleware_stack', 'warm'): measure(request, repeat),
+        }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(repeat):
+    cases = []
+    for depth in DEPTHS:
+        for width in WIDTHS:
+            user = build_user(depth, width)
+            results = benchmark_user(user, repeat)
+            results.update(benchmark_middleware(user, max(repeat // 10, 10)))
+            for (operation, cache_state), result in results.items():
+                cases.append({
+                    'case': f'depth={depth} width={width} {operation} {cache_state}',
+                    'depth': depth,
+                    'width': width,
+                    'operation': operation,
+                    'cache': cache_state,
+                    **result,
+                })
+    return cases
+
+
+def compare(cases, baseline_path):
+    """Print the change of each case relative to a previous result file."""
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = {case['case']: case for case in json.load(baseline_file)['cases']}
+    print(f"{'case':<55} {'queries':>12} {'mean ms':>22}")
+    for case in cases:
+        old = baseline.get(case['case'])
+        if old is None:
+            continue
+        ratio = case['mean_ms'] / old['mean_ms'] if old['mean_ms'] else float('inf')
+        print(
+            f"{case['case']:<55} {old['queries']:>5.1f} -> {case['queries']:<5.1f}"
+            f" {old['mean_ms']:>8.3f} -> {case['mean_ms']:<8.3f} ({ratio:.2f}x)"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--repeat', type=int, default=200, help='Runs per measured case')
+    parser.add_argument('--output', default='permission_benchmark.json', help='Result file to write')
+    parser.add_argument('--compare', help='Previous result file to compare against')
+    args = parser.parse_args()
+
+    with test_database():
+        cases = run(args.repeat)
+
+    report = {
+        'revision': git_revision(),
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'repeat': args.repeat,
+        'cases': cases,
+    }
+    with open(args.output, 'w', encoding='utf-8') as output_file:
+        json.dump(report, output_file, indent=2)
+
+    print_results('Permission resolution', {case['case']: case for case in cases})
+    print(f'Results written to {args.output}')
+    if args.compare:
+        compare(cases, args.compare)
+
+
+if __name__ == '__main__':
+    main()
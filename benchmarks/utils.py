@@ -0,0 +1,70 @@
+"""
+Shared helpers for the benchmark scripts.
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+
+def setup_django():
+    """Configure Django using the development settings unless overridden."""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings.development')
+    import django
+    django.setup()
+
+
+@contextmanager
+def test_database():
+    """Create a throwaway test database for the duration of the block."""
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def measure(func, repeat=100, setup=None):
+    """
+    Call ``func`` ``repeat`` times and report its query count and latency.
+
+    ``setup`` is called before each run and is excluded from the results.
+    """
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    timings = []
+    queries = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        with CaptureQueriesContext(connection) as context:
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        queries.append(len(context.captured_queries))
+
+    return {
+        'runs': repeat,
+        'queries': statistics.mean(queries),
+        'mean_ms': statistics.mean(timings),
+        'median_ms': statistics.median(timings),
+        'p95_ms': sorted(timings)[int(len(timings) * 0.95) - 1],
+    }
+
+
+def print_results(title, results):
+    """Print a table of named measurement results."""
+    print(title)
+    print(f"{'case':<40} {'queries':>8} {'mean ms':>10} {'median ms':>10} {'p95 ms':>10}")
+    for name, result in results.items():
+        print(
+            f"{name:<40} {result['queries']:>8.1f} {result['mean_ms']:>10.3f} "
+            f"{result['median_ms']:>10.3f} {result['p95_ms']:>10.3f}"
+        )
@@ -0,0 +1,64 @@
+"""
+Benchmark the memory and accuracy of HyperLogLog viewer sketches.
+
+Feeds a stream of views drawn from a fixed population of viewers into a
+HyperLogLog sketch and into an exact set of viewer keys, and reports the
+memory of both, the estimation error and the time per view, per million
+views.
+
+Usage: python -m benchmarks.viewer_sketches [--views N] [--viewers N] [--precision P]
+"""
+import argparse
+import random
+import sys
+import time
+
+from community.hyperloglog import HyperLogLog
+
+
+def set_size(values):
+    """Approximate memory of a set of strings, including the strings."""
+    return sys.getsizeof(values) + sum(sys.getsizeof(value) for value in values)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--views', type=int, default=1_000_000, help='Views to record')
+    parser.add_argument('--viewers', type=int, default=250_000, help='Distinct viewers the views come from')
+    parser.add_argument('--precision', type=int, default=12, help='Sketch precision')
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    keys = [f'user:{rng.randrange(args.viewers * 10)}' for _ in range(args.viewers)]
+    views = [rng.choice(keys) for _ in range(args.views)]
+
+    sketch = HyperLogLog(precision=args.precision)
+    start = time.perf_counter()
+    for viewer in views:
+        sketch.add(viewer)
+    sketch_seconds = time.perf_counter() - start
+
+    exact = set()
+    start = time.perf_counter()
+    for viewer in views:
+        exact.add(viewer)
+    set_seconds = time.perf_counter() - start
+
+    estimate = sketch.count()
+    per_million = 1_000_000 / args.views
+    print(f'Views: {args.views}, distinct viewers: {len(exact)}, precision: {args.precision}')
+    print(f"{'structure':<12} {'bytes':>12} {'bytes/1M views':>16} {'us/view':>10} {'estimate':>10} {'error %':>8}")
+    print(
+        f"{'hyperloglog':<12} {len(sketch.to_bytes()):>12} {len(sketch.to_bytes()):>16} "
+        f"{sketch_seconds / args.views * 1e6:>10.3f} {estimate:>10} "
+        f"{(estimate - len(exact)) / len(exact) * 100:>8.2f}"
+    )
+    exact_bytes = set_size(exact)
+    print(
+        f"{'exact set':<12} {exact_bytes:>12} {round(exact_bytes * per_million):>16} "
+        f"{set_seconds / args.views * 1e6:>10.3f} {len(exact):>10} {0:>8.2f}"
+    )
+
+
+if __name__ == '__main__':
+    main()
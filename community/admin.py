@@ -1,6 +1,9 @@
 from django.contrib import admin
 from django.utils.safestring import mark_safe
-from .models import Category, Board, Report, Notice, FAQ, Post, Comment, Media
+from .models import (
+    Category, Board, Report, Notice, FAQ, Post, Comment, Media,
+    PostViewerSketch, BoardViewerSketch,
+)
 
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
@@ -18,6 +21,14 @@ class BoardAdmin(admin.ModelAdmin):
     prepopulated_fields = {'slug': ('name',)}
     filter_horizontal = ('moderators',)
     ordering = ('category', 'order', 'name')
+    readonly_fields = ('unique_viewers',)
+
+    def unique_viewers(self, obj):
+        if obj.pk is None:
+            return '-'
+        return BoardViewerSketch.estimate_viewers(obj)
+
+    unique_viewers.short_description = 'Unique viewers (estimated)'
 
 @admin.register(Report)
 class ReportAdmin(admin.ModelAdmin):
@@ -65,10 +76,10 @@ class FAQAdmin(admin.ModelAdmin):
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'board', 'author', 'is_pinned', 'is_locked', 'view_count', 'created_at')
+    list_display = ('title', 'board', 'author', 'is_pinned', 'is_locked', 'view_count', 'like_count', 'created_at')
     list_filter = ('board', 'is_pinned', 'is_locked')
     search_fields = ('title', 'content', 'author__username')
-    readonly_fields = ('view_count', 'created_at', 'updated_at')
+    readonly_fields = ('view_count', 'like_count', 'unique_viewers', 'created_at', 'updated_at')
     fieldsets = (
         (None, {
             'fields': ('title', 'content', 'board', 'author')
@@ -77,13 +88,20 @@ class PostAdmin(admin.ModelAdmin):
             'fields': ('is_pinned', 'is_locked')
         }),
         ('Statistics', {
-            'fields': ('view_count',)
+            'fields': ('view_count', 'like_count', 'unique_viewers')
         }),
         ('Timestamps', {
             'fields': ('created_at', 'updated_at')
         }),
     )
 
+    def unique_viewers(self, obj):
+        if obj.pk is None:
+            return '-'
+        return PostViewerSketch.estimate_viewers(obj)
+
+    unique_viewers.short_description = 'Unique viewers (estimated)'
+
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -128,3 +146,34 @@ class MediaAdmin(admin.ModelAdmin):
 
     image_preview.short_description = 'Image Preview'
     webp_preview.short_description = 'WebP Preview'
+
+
+class ViewerSketchAdmin(admin.ModelAdmin):
+    list_display = ('date', 'estimated_viewers')
+    date_hierarchy = 'date'
+    exclude = ('registers',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def estimated_viewers(self, obj):
+        return obj.get_sketch().count()
+
+    estimated_viewers.short_description = 'Unique viewers (estimated)'
+
+
+@admin.register(PostViewerSketch)
+class PostViewerSketchAdmin(ViewerSketchAdmin):
+    list_display = ('post',) + ViewerSketchAdmin.list_display
+    list_select_related = ('post',)
+    search_fields = ('post__title',)
+
+
+@admin.register(BoardViewerSketch)
+class BoardViewerSketchAdmin(ViewerSketchAdmin):
+    list_display = ('board',) + ViewerSketchAdmin.list_display
+    list_select_related = ('board',)
+    list_filter = ('board',)
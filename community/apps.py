@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class CommunityConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'community'
+
+    def ready(self):
+        """
+        Import signals when the app is ready.
+        """
+        import community.signals
@@ -0,0 +1,77 @@
+"""
+HyperLogLog sketches for estimating numbers of distinct values.
+
+A sketch with precision p keeps 2**p one-byte registers (4 KB for the
+default p=12) regardless of how many values are added, estimates the number
+of distinct values with a standard error of about 1.04 / sqrt(2**p) (1.6%
+for p=12), and can be merged with another sketch of the same precision to
+estimate the distinct values of both.
+"""
+import hashlib
+import math
+
+HASH_BITS = 64
+
+
+class HyperLogLog:
+    """
+    A HyperLogLog sketch.
+    """
+
+    def __init__(self, precision=12, registers=None):
+        self.precision = precision
+        self.size = 1 << precision
+        if registers is None:
+            registers = bytearray(self.size)
+        elif len(registers) != self.size:
+            raise ValueError(f'Expected {self.size} registers, got {len(registers)}')
+        self.registers = bytearray(registers)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Load a sketch from the registers stored by to_bytes().
+        """
+        precision = len(data).bit_length() - 1
+        return cls(precision=precision, registers=data)
+
+    def to_bytes(self):
+        """
+        Get the registers of the sketch for storage.
+        """
+        return bytes(self.registers)
+
+    def add(self, value):
+        """
+        Add a value, which is hashed through its string form.
+        """
+        digest = hashlib.blake2b(str(value).encode(), digest_size=HASH_BITS // 8).digest()
+        x = int.from_bytes(digest, 'big')
+        # The first p bits select the register, the rest give the rank:
+        # the position of their leftmost 1 bit
+        index = x >> (HASH_BITS - self.precision)
+        rest_bits = HASH_BITS - self.precision
+        rank = rest_bits - (x & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """
+        Merge another sketch of the same precision into this one.
+        """
+        if other.precision != self.precision:
+            raise ValueError('Cannot merge sketches of different precision')
+        self.registers = bytearray(map(max, self.registers, other.registers))
+
+    def count(self):
+        """
+        Estimate the number of distinct values added.
+        """
+        m = self.size
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0 ** -register for register in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting
+            return round(m * math.log(m / zeros))
+        return round(estimate)
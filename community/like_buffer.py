@@ -0,0 +1,220 @@
+"""
+Write-behind buffering of like toggles.
+
+With LIKE_WRITE_BEHIND enabled, LikeableMixin.toggle_like() records the like
+or unlike intent of a user in a per-process LikeBuffer instead of writing
+the Like table, and answers with an optimistic like count. The buffer keeps
+only the net change per (object, user) pair and writes all of them with a
+bulk insert and bulk deletes when it holds LIKE_BUFFER_MAX_SIZE pairs or
+LIKE_BUFFER_FLUSH_INTERVAL seconds after the first pending toggle. The like
+counts of the touched objects are then recomputed from the Like table.
+
+Pending toggles are flushed when the process exits; a crashed process loses
+at most the toggles of one flush interval.
+"""
+import atexit
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections, transaction
+from django.db.models import Q
+
+logger = logging.getLogger(__name__)
+
+
+class LikeBuffer:
+    """
+    Per-process buffer of like toggles.
+    """
+
+    # Pairs deleted per DELETE statement on flush
+    delete_batch_size = 500
+
+    def __init__(self, max_size=1000, flush_interval=5):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        # {(content type id, object id, user id): (liked, liked in database)}
+        self._pending = {}
+        # {(content type id, object id): net change of the like count}
+        self._deltas = defaultdict(int)
+        # Pairs and like count changes of the flush in progress, which
+        # toggles take as the stored state until the flush commits
+        # {(content type id, object id, user id): liked}
+        self._flushing = {}
+        # {(content type id, object id): net change of the like count}
+        self._flushing_deltas = {}
+        self._lock = threading.Lock()
+        # Held for the whole of a flush, so flushes run one at a time
+        self._flush_lock = threading.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def _get_entry(self, key):
+        """
+        Get the (liked, liked in database) entry of a pair, taking the pairs
+        of the flush in progress as stored. Call with the lock held.
+        """
+        entry = self._pending.get(key)
+        if entry is None and key in self._flushing:
+            entry = (self._flushing[key], self._flushing[key])
+        return entry
+
+    def toggle(self, obj, user):
+        """
+        Record a like toggle of the given user on the given object.
+        Returns True if the object is now liked, False if unliked, and adds
+        the pending toggles to the stored count in ``obj.like_count``.
+        """
+        from .models import Like
+
+        content_type = ContentType.objects.get_for_model(obj)
+        key = (content_type.id, obj.pk, user.pk)
+        with self._lock:
+            entry = self._get_entry(key)
+        if entry is None:
+            db_liked = Like.objects.filter(
+                user=user,
+                content_type=content_type,
+                object_id=obj.pk
+            ).exists()
+        else:
+            db_liked = entry[1]
+
+        with self._lock:
+            # Another toggle of the same pair may have been recorded meanwhile
+            entry = self._get_entry(key) or (db_liked, db_liked)
+            liked = not entry[0]
+            if liked == entry[1]:
+                # Back to the stored state, nothing to write
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = (liked, entry[1])
+            object_key = (content_type.id, obj.pk)
+            self._deltas[object_key] += 1 if liked else -1
+            obj.like_count = max(
+                obj.like_count + self._deltas[object_key] + self._flushing_deltas.get(object_key, 0), 0
+            )
+            if not self._deltas[object_key]:
+                del self._deltas[object_key]
+            full = len(self._pending) >= self.max_size
+            if not full and self._pending and self._timer is None:
+                self._timer = threading.Timer(self.flush_interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+        if full:
+            self.flush()
+        return liked
+
+    def flush(self):
+        """
+        Write the net changes of the pending toggles to the database.
+        Returns the number of (object, user) pairs written.
+
+        Until the write commits, the pairs are kept as in flight, so that
+        toggles meanwhile start from their new state; if it fails, they
+        are merged back into the pending toggles.
+        """
+        with self._flush_lock:
+            return self._flush()
+
+    def _flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._flushing = {key: liked for key, (liked, _db_liked) in pending.items()}
+            self._flushing_deltas, self._deltas = dict(self._deltas), defaultdict(int)
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+
+        try:
+            self._write(pending)
+        except Exception:
+            with self._lock:
+                self._restore(pending)
+            raise
+        finally:
+            with self._lock:
+                self._flushing = {}
+                self._flushing_deltas = {}
+        return len(pending)
+
+    def _restore(self, pending):
+        """
+        Merge the pairs of a failed flush back into the pending toggles.
+        Call with the lock held.
+        """
+        for key, (liked, db_liked) in pending.items():
+            entry = self._pending.get(key)
+            if entry is not None:
+                # Toggled again during the flush, from the unwritten state
+                liked = entry[0]
+            if liked == db_liked:
+                self._pending.pop(key, None)
+            else:
+                self._pending[key] = (liked, db_liked)
+        for object_key, delta in self._flushing_deltas.items():
+            self._deltas[object_key] += delta
+
+    def _write(self, pending):
+        """
+        Write the net changes of the given pairs and recount their objects.
+        """
+        from .models import Like
+
+        new_likes = []
+        unliked_users = defaultdict(list)
+        touched = defaultdict(set)
+        for (content_type_id, object_id, user_id), (liked, _db_liked) in pending.items():
+            if liked:
+                new_likes.append(Like(content_type_id=content_type_id, object_id=object_id, user_id=user_id))
+            else:
+                unliked_users[(content_type_id, object_id)].append(user_id)
+            touched[content_type_id].add(object_id)
+
+        unliked_users = list(unliked_users.items())
+        with transaction.atomic():
+            Like.objects.bulk_create(new_likes, ignore_conflicts=True)
+            for start in range(0, len(unliked_users), self.delete_batch_size):
+                condition = Q()
+                for (content_type_id, object_id), user_ids in unliked_users[start:start + self.delete_batch_size]:
+                    condition |= Q(content_type_id=content_type_id, object_id=object_id, user_id__in=user_ids)
+                Like.objects.filter(condition).delete()
+            for content_type_id, object_ids in touched.items():
+                model = ContentType.objects.get_for_id(content_type_id).model_class()
+                model.recount_likes(object_ids)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Flushing buffered likes failed')
+        finally:
+            # The timer thread's connections are not reused
+            connections.close_all()
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_like_buffer():
+    """
+    Get the like buffer of this process, configured from the settings.
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = LikeBuffer(
+                max_size=getattr(settings, 'LIKE_BUFFER_MAX_SIZE', 1000),
+                flush_interval=getattr(settings, 'LIKE_BUFFER_FLUSH_INTERVAL', 5),
+            )
+            atexit.register(_buffer.flush)
+        return _buffer
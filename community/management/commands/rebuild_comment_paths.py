@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from community.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the materialized paths of comment threads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Comments updated per query')
+
+    def handle(self, *args, **options):
+        rebuilt = 0
+        post_ids = Post.objects.filter(comments__isnull=False).distinct().values_list('pk', flat=True)
+        for post_id in post_ids.iterator():
+            # Parents have lower IDs than their replies, so ID order visits
+            # every parent before its children
+            comments = list(
+                Comment.objects.filter(post_id=post_id).order_by('pk').only('pk', 'parent_id', 'path', 'depth')
+            )
+            by_id = {}
+            for comment in comments:
+                comment.build_path(by_id.get(comment.parent_id))
+                by_id[comment.pk] = comment
+            with transaction.atomic():
+                Comment.objects.bulk_update(comments, ['path', 'depth'], batch_size=options['batch_size'])
+            rebuilt += len(comments)
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt paths of {rebuilt} comments'))
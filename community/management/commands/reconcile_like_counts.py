@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from community.models import Comment, Post
+
+
+class Command(BaseCommand):
+    help = 'Repair drift between the stored like counts and the Like table'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Objects checked per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        for model in (Post, Comment):
+            pks = list(model.objects.order_by('pk').values_list('pk', flat=True))
+            repaired = 0
+            for start in range(0, len(pks), batch_size):
+                repaired += model.recount_likes(pks[start:start + batch_size])
+            name = model._meta.verbose_name_plural
+            if repaired:
+                self.stdout.write(self.style.SUCCESS(f'Repaired like counts of {repaired} {name}'))
+            else:
+                self.stdout.write(f'Like counts of all {name} are up to date')
@@ -0,0 +1,63 @@
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from community.models import Comment, Post
+from community.rendering import render_chunk
+
+
+class Command(BaseCommand):
+    help = 'Store the rendered HTML of posts and comments that have none'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows rendered and updated per chunk')
+        parser.add_argument('--workers', type=int, default=4, help='Processes rendering chunks in parallel')
+        parser.add_argument('--all', action='store_true', help='Re-render rows that already have HTML')
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            for model in (Post, Comment):
+                rendered = self.render_model(model, executor, workers, options)
+                self.stdout.write(self.style.SUCCESS(
+                    f'Rendered HTML of {rendered} {model._meta.verbose_name_plural}'
+                ))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+
+    def render_model(self, model, executor, workers, options):
+        """
+        Render the rows of a model in chunks, ``workers`` chunks at a time,
+        and write each chunk with one bulk update.
+        """
+        batch_size = options['batch_size']
+        queryset = model.objects.order_by('pk')
+        if not options['all']:
+            queryset = queryset.filter(content_html='')
+
+        rendered = 0
+        last_pk = 0
+        while True:
+            # Read the next chunks by primary key ranges, so rows updated
+            # meanwhile are not skipped or read twice
+            chunks = []
+            for _ in range(workers):
+                rows = list(queryset.filter(pk__gt=last_pk).values_list('pk', 'content')[:batch_size])
+                if not rows:
+                    break
+                chunks.append(rows)
+                last_pk = rows[-1][0]
+            if not chunks:
+                return rendered
+
+            results = executor.map(render_chunk, chunks) if executor else map(render_chunk, chunks)
+            for pairs in results:
+                with transaction.atomic():
+                    model.objects.bulk_update(
+                        [model(pk=pk, content_html=html) for pk, html in pairs],
+                        ['content_html'],
+                    )
+                rendered += len(pairs)
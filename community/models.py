@@ -1,14 +1,21 @@
-from django.db import models
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.utils.text import slugify
 from PIL import Image
 import os
+from collections import defaultdict
 from io import BytesIO
 from django.core.files.base import ContentFile
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.contenttypes.models import ContentType
 
+from .hyperloglog import HyperLogLog
+from .page_cache import bump_post_version, bump_post_versions
+from .rendering import render_content
+
 class Category(models.Model):
     """
     Category model for organizing boards.
@@ -202,7 +209,156 @@ class FAQ(models.Model):
         ordering = ['order', 'category', 'question']
 
 
-class Post(models.Model):
+class LikeableMixin:
+    """
+    Like handling shared by the models that can be liked.
+
+    The model keeps the number of its likes in a denormalized ``like_count``
+    column, which toggle_like() updates in the same transaction as the Like
+    row; the reconcile_like_counts command repairs any drift.
+    ``page_post_field`` names the field holding the ID of the post whose
+    page shows the object.
+    """
+
+    page_post_field = None
+
+    def get_like_count(self):
+        """
+        Get the total number of likes.
+        """
+        return self.like_count
+
+    def is_liked_by(self, user):
+        """
+        Check if the object is liked by the given user.
+        """
+        if not user.is_authenticated:
+            return False
+        return self.likes.filter(user=user).exists()
+
+    def toggle_like(self, user):
+        """
+        Toggle like status for the given user.
+        Returns True if the object was liked, False if unliked.
+
+        The toggle deletes the user's like or, if there was none, inserts
+        one, and adjusts ``like_count`` in the same transaction. An insert
+        that loses a race against a concurrent like of the same user (e.g.
+        a double click) leaves the object liked and the count unchanged.
+        ``like_count`` of the instance is updated without reading it back.
+
+        With LIKE_WRITE_BEHIND enabled the toggle is recorded in the like
+        buffer of the process and written in a later batch.
+        """
+        if not user.is_authenticated:
+            return False
+
+        if getattr(settings, 'LIKE_WRITE_BEHIND', False):
+            from .like_buffer import get_like_buffer
+            return get_like_buffer().toggle(self, user)
+
+        content_type = ContentType.objects.get_for_model(self)
+        with transaction.atomic():
+            # Unlike
+            deleted, _ = Like.objects.filter(
+                user=user,
+                content_type=content_type,
+                object_id=self.id
+            ).delete()
+            if deleted:
+                delta = -deleted
+            else:
+                # Like
+                try:
+                    with transaction.atomic():
+                        Like.objects.create(
+                            user=user,
+                            content_type=content_type,
+                            object_id=self.id
+                        )
+                except IntegrityError:
+                    # Liked by a concurrent request of the same user
+                    return True
+                delta = 1
+            type(self).objects.filter(pk=self.pk).update(like_count=F('like_count') + delta)
+        self.like_count = max(self.like_count + delta, 0)
+        bump_post_version(getattr(self, self.page_post_field))
+        return delta > 0
+
+    @classmethod
+    def invalidate_pages(cls, pks):
+        """
+        Invalidate the cached pages of the posts showing the given objects.
+        """
+        bump_post_versions(cls.objects.filter(pk__in=pks).values_list(cls.page_post_field, flat=True))
+
+    @classmethod
+    def get_liked_ids(cls, user, object_ids):
+        """
+        Get the set of IDs among ``object_ids`` that the given user has liked.
+
+        ``object_ids`` may be a list or a values() queryset, which is then
+        evaluated as a subquery, so the lookup costs a single query.
+        """
+        if not user.is_authenticated:
+            return set()
+        content_type = ContentType.objects.get_for_model(cls)
+        return set(
+            Like.objects.filter(
+                user=user,
+                content_type=content_type,
+                object_id__in=object_ids
+            ).values_list('object_id', flat=True)
+        )
+
+    @classmethod
+    def recount_likes(cls, pks=None):
+        """
+        Recompute ``like_count`` from the Like table for the given objects,
+        or all objects, whose stored count has drifted.
+        Returns the number of objects repaired.
+        """
+        content_type = ContentType.objects.get_for_model(cls)
+        actual_count = Coalesce(
+            Subquery(
+                Like.objects.filter(content_type=content_type, object_id=OuterRef('pk'))
+                .values('object_id')
+                .annotate(count=Count('id'))
+                .values('count')
+            ),
+            0,
+        )
+        drifted = cls.objects.annotate(actual_count=actual_count).exclude(
+            like_count=F('actual_count')
+        )
+        if pks is not None:
+            drifted = drifted.filter(pk__in=pks)
+        drifted_pks = list(drifted.values_list('pk', flat=True))
+        if drifted_pks:
+            cls.objects.filter(pk__in=drifted_pks).update(like_count=actual_count)
+            cls.invalidate_pages(drifted_pks)
+        return len(drifted_pks)
+
+
+class RenderedContentMixin:
+    """
+    Keeps the HTML rendering of ``content`` in ``content_html``.
+
+    The HTML is rendered when the content is saved, so templates output the
+    stored HTML instead of re-rendering the text on every page view; the
+    render_content_html command backfills existing rows.
+    """
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            self.content_html = render_content(self.content)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'content_html'}
+        super().save(*args, **kwargs)
+
+
+class Post(LikeableMixin, RenderedContentMixin, models.Model):
     """
     Post model for user-created content.
 
@@ -210,6 +366,7 @@ class Post(models.Model):
     """
     title = models.CharField(_('title'), max_length=200)
     content = models.TextField(_('content'))
+    content_html = models.TextField(_('content HTML'), blank=True, editable=False)
     board = models.ForeignKey(
         Board,
         on_delete=models.CASCADE,
@@ -226,57 +383,22 @@ class Post(models.Model):
     is_locked = models.BooleanField(_('is locked'), default=False)
     view_count = models.PositiveIntegerField(_('view count'), default=0)
     likes = GenericRelation('Like', related_query_name='post')
+    like_count = models.PositiveIntegerField(_('like count'), default=0, editable=False)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
+    page_post_field = 'pk'
+
     def __str__(self):
         return self.title
 
-    def get_like_count(self):
-        """
-        Get the total number of likes for this post.
-        """
-        return self.likes.count()
-
-    def is_liked_by(self, user):
-        """
-        Check if the post is liked by the given user.
-        """
-        if not user.is_authenticated:
-            return False
-        return self.likes.filter(user=user).exists()
-
-    def toggle_like(self, user):
-        """
-        Toggle like status for the given user.
-        Returns True if the post was liked, False if unliked.
-        """
-        if not user.is_authenticated:
-            return False
-
-        like = self.likes.filter(user=user).first()
-        if like:
-            # Unlike
-            like.delete()
-            return False
-        else:
-            # Like
-            from django.contrib.contenttypes.models import ContentType
-            content_type = ContentType.objects.get_for_model(self)
-            Like.objects.create(
-                user=user,
-                content_type=content_type,
-                object_id=self.id
-            )
-            return True
-
     class Meta:
         verbose_name = _('post')
         verbose_name_plural = _('posts')
         ordering = ['-is_pinned', '-created_at']
 
 
-class Comment(models.Model):
+class Comment(LikeableMixin, RenderedContentMixin, models.Model):
     """
     Comment model for user responses to posts.
 
@@ -295,6 +417,7 @@ class Comment(models.Model):
         verbose_name=_('author')
     )
     content = models.TextField(_('content'))
+    content_html = models.TextField(_('content HTML'), blank=True, editable=False)
     parent = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
@@ -304,54 +427,76 @@ class Comment(models.Model):
         verbose_name=_('parent comment')
     )
     likes = GenericRelation('Like', related_query_name='comment')
+    like_count = models.PositiveIntegerField(_('like count'), default=0, editable=False)
+    # Materialized path: the IDs of the ancestors and the comment itself as
+    # fixed-width base-36 segments joined by dots, so ordering by path yields
+    # the thread in depth-first order. A text column, as a path grows by a
+    # segment per level and threads have no depth limit
+    path = models.TextField(_('path'), blank=True, editable=False)
+    depth = models.PositiveIntegerField(_('depth'), default=0, editable=False)
     created_at = models.DateTimeField(_('created at'), auto_now_add=True)
     updated_at = models.DateTimeField(_('updated at'), auto_now=True)
 
+    page_post_field = 'post_id'
+
+    PATH_SEGMENT_WIDTH = 8
+    PATH_SEPARATOR = '.'
+    # Sorts after every character used in paths
+    PATH_END = '~'
+
     def __str__(self):
         return f"Comment by {self.author} on {self.post}"
 
-    def get_like_count(self):
+    @classmethod
+    def path_segment(cls, pk):
         """
-        Get the total number of likes for this comment.
+        Get the path segment of a comment ID, e.g. 35 -> '0000000z'.
         """
-        return self.likes.count()
+        digits = ''
+        while pk:
+            pk, remainder = divmod(pk, 36)
+            digits = '0123456789abcdefghijklmnopqrstuvwxyz'[remainder] + digits
+        return digits.rjust(cls.PATH_SEGMENT_WIDTH, '0')
 
-    def is_liked_by(self, user):
+    def build_path(self, parent=None):
         """
-        Check if the comment is liked by the given user.
+        Set ``path`` and ``depth`` from the given parent comment.
         """
-        if not user.is_authenticated:
-            return False
-        return self.likes.filter(user=user).exists()
+        segment = self.path_segment(self.pk)
+        if parent is None:
+            self.path, self.depth = segment, 0
+        else:
+            self.path = parent.path + self.PATH_SEPARATOR + segment
+            self.depth = parent.depth + 1
 
-    def toggle_like(self, user):
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # The path ends with the comment's own ID, known only after the insert
+        if not self.path:
+            self.build_path(self.parent)
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+
+    def get_subtree(self):
         """
-        Toggle like status for the given user.
-        Returns True if the comment was liked, False if unliked.
+        Get the comment and all of its descendants in thread order with one
+        range query on the (post, path) index.
         """
-        if not user.is_authenticated:
-            return False
-
-        like = self.likes.filter(user=user).first()
-        if like:
-            # Unlike
-            like.delete()
-            return False
-        else:
-            # Like
-            from django.contrib.contenttypes.models import ContentType
-            content_type = ContentType.objects.get_for_model(self)
-            Like.objects.create(
-                user=user,
-                content_type=content_type,
-                object_id=self.id
-            )
-            return True
+        return Comment.objects.filter(
+            post_id=self.post_id,
+            path__gte=self.path,
+            path__lt=self.path + self.PATH_END,
+        ).order_by('path')
 
     class Meta:
         verbose_name = _('comment')
         verbose_name_plural = _('comments')
         ordering = ['created_at']
+        indexes = [
+            # Threads and subtrees in depth-first order
+            models.Index(fields=['post', 'path'], name='comment_post_path_idx'),
+            # Keyset pagination of the top-level comments of a post
+            models.Index(fields=['post', 'parent', 'created_at'], name='comment_post_parent_idx'),
+        ]
 
 
 class Media(models.Model):
@@ -431,9 +576,157 @@ class Like(models.Model):
     def __str__(self):
         return f"{self.user} likes {self.content_object}"
 
+    @classmethod
+    def load_content_objects(cls, likes, querysets=None):
+        """
+        Resolve the liked objects of the given likes with one in_bulk()
+        query per content type, instead of one query per like.
+
+        ``querysets`` optionally maps a model to the queryset its objects are
+        loaded from, e.g. to select related objects. Returns the likes whose
+        object still exists, with ``content_object`` set.
+        """
+        querysets = querysets or {}
+        object_ids = defaultdict(set)
+        for like in likes:
+            object_ids[like.content_type_id].add(like.object_id)
+
+        objects = {}
+        for content_type_id, ids in object_ids.items():
+            model = ContentType.objects.get_for_id(content_type_id).model_class()
+            queryset = querysets.get(model, model._default_manager)
+            objects[content_type_id] = queryset.in_bulk(ids)
+
+        resolved = []
+        for like in likes:
+            obj = objects[like.content_type_id].get(like.object_id)
+            if obj is not None:
+                like.content_object = obj
+                resolved.append(like)
+        return resolved
+
     class Meta:
         verbose_name = _('like')
         verbose_name_plural = _('likes')
         ordering = ['-created_at']
         # Ensure a user can only like a specific object once
         unique_together = ('user', 'content_type', 'object_id')
+        indexes = [
+            # Keyset pagination of a user's likes, newest first
+            models.Index(fields=['user', '-created_at', '-id'], name='like_user_created_idx'),
+        ]
+
+
+class ViewerSketch(models.Model):
+    """
+    Abstract daily HyperLogLog sketch of the distinct viewers of an object.
+
+    Subclasses add a foreign key to the viewed object named by
+    ``owner_field``. Sketches are a few KB each and mergeable, so the
+    distinct viewers of any range of days are estimated by merging them.
+    """
+    date = models.DateField(_('date'))
+    registers = models.BinaryField(_('registers'))
+
+    owner_field = None
+
+    def get_sketch(self):
+        """
+        Get the stored sketch.
+        """
+        return HyperLogLog.from_bytes(bytes(self.registers))
+
+    @classmethod
+    def merge_sketches(cls, date, sketches):
+        """
+        Merge {owner ID: HyperLogLog} sketches into the stored sketches of
+        the given day, creating missing rows, with a fixed number of queries.
+        """
+        if not sketches:
+            return
+        owner_model = cls._meta.get_field(cls.owner_field).related_model
+        existing = owner_model.objects.filter(pk__in=list(sketches)).values_list('pk', flat=True)
+        # Skip objects deleted since their sketches were collected
+        sketches = {pk: sketches[pk] for pk in existing}
+        if not sketches:
+            return
+        owner_id = f'{cls.owner_field}_id'
+        with transaction.atomic():
+            # Create missing rows first, so concurrent flushes of other
+            # workers merge into the same rows instead of overwriting them
+            cls.objects.bulk_create(
+                [
+                    cls(date=date, registers=HyperLogLog().to_bytes(), **{owner_id: pk})
+                    for pk in sketches
+                ],
+                ignore_conflicts=True,
+            )
+            rows = list(
+                cls.objects.select_for_update().filter(date=date, **{f'{owner_id}__in': list(sketches)})
+            )
+            for row in rows:
+                sketch = row.get_sketch()
+                sketch.merge(sketches[getattr(row, owner_id)])
+                row.registers = sketch.to_bytes()
+            cls.objects.bulk_update(rows, ['registers'])
+
+    @classmethod
+    def estimate_viewers(cls, owner, since=None):
+        """
+        Estimate the distinct viewers of an object, optionally since a day.
+        """
+        rows = cls.objects.filter(**{cls.owner_field: owner})
+        if since is not None:
+            rows = rows.filter(date__gte=since)
+        total = HyperLogLog()
+        for registers in rows.values_list('registers', flat=True).iterator():
+            total.merge(HyperLogLog.from_bytes(bytes(registers)))
+        return total.count()
+
+    class Meta:
+        abstract = True
+        ordering = ['-date']
+
+
+class PostViewerSketch(ViewerSketch):
+    """
+    Daily sketch of the distinct viewers of a post.
+    """
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='viewer_sketches',
+        verbose_name=_('post')
+    )
+
+    owner_field = 'post'
+
+    def __str__(self):
+        return f"Viewers of {self.post} on {self.date}"
+
+    class Meta(ViewerSketch.Meta):
+        verbose_name = _('post viewer sketch')
+        verbose_name_plural = _('post viewer sketches')
+        unique_together = ('post', 'date')
+
+
+class BoardViewerSketch(ViewerSketch):
+    """
+    Daily sketch of the distinct viewers of the posts of a board.
+    """
+    board = models.ForeignKey(
+        Board,
+        on_delete=models.CASCADE,
+        related_name='viewer_sketches',
+        verbose_name=_('board')
+    )
+
+    owner_field = 'board'
+
+    def __str__(self):
+        return f"Viewers of {self.board} on {self.date}"
+
+    class Meta(ViewerSketch.Meta):
+        verbose_name = _('board viewer sketch')
+        verbose_name_plural = _('board viewer sketches')
+        unique_together = ('board', 'date')
@@ -0,0 +1,97 @@
+"""
+Full-page cache of post pages and their validators for conditional GETs.
+
+Pages rendered for anonymous readers are stored in Django's cache framework
+under keys embedding a per-post version. Any change to the post, its
+comments, its media or the likes on them bumps that version, which makes
+every cached page of the post stale at once, and records the time of the
+change. Both are the validators of the post page: the version is part of
+its ETag and the time of the last change is its Last-Modified, so
+validating a request reads neither the comments nor the likes.
+"""
+import hashlib
+import time
+from datetime import datetime, timezone
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+
+VERSION_KEY_TEMPLATE = 'post_page:version:{post_id}'
+MODIFIED_KEY_TEMPLATE = 'post_page:modified:{post_id}'
+PAGE_KEY_TEMPLATE = 'post_page:{post_id}:v{version}:{path}'
+
+
+def get_cache():
+    """Get the cache backend used for post pages."""
+    return caches[getattr(settings, 'POST_PAGE_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    """Get the lifetime in seconds of cached post pages."""
+    return getattr(settings, 'POST_PAGE_CACHE_TIMEOUT', 300)
+
+
+def get_post_validators(post_id):
+    """
+    Get the current page version of a post and the time of its last change,
+    initializing them if necessary.
+
+    The initial values are the current time, so that a version evicted from
+    the cache never resurrects pages written under an older version, and an
+    evicted modification time never makes clients keep an outdated page.
+    """
+    cache = get_cache()
+    version_key = VERSION_KEY_TEMPLATE.format(post_id=post_id)
+    modified_key = MODIFIED_KEY_TEMPLATE.format(post_id=post_id)
+    values = cache.get_many([version_key, modified_key])
+    if version_key not in values:
+        cache.add(version_key, time.time_ns(), timeout=None)
+        values[version_key] = cache.get(version_key)
+    if modified_key not in values:
+        cache.add(modified_key, time.time(), timeout=None)
+        values[modified_key] = cache.get(modified_key)
+    return values[version_key], datetime.fromtimestamp(values[modified_key], tz=timezone.utc)
+
+
+def bump_post_version(post_id):
+    """
+    Invalidate the cached pages of a post once the current transaction
+    commits. Bumping earlier would let a concurrent request store a page
+    rendered from the uncommitted, old data under the new version.
+    """
+    transaction.on_commit(partial(_bump_post_version, post_id))
+
+
+def _bump_post_version(post_id):
+    cache = get_cache()
+    key = VERSION_KEY_TEMPLATE.format(post_id=post_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The version was never set or has been evicted
+        cache.set(key, time.time_ns(), timeout=None)
+    cache.set(MODIFIED_KEY_TEMPLATE.format(post_id=post_id), time.time(), timeout=None)
+
+
+def bump_post_versions(post_ids):
+    """Invalidate the cached pages of several posts."""
+    for post_id in set(post_ids):
+        bump_post_version(post_id)
+
+
+def _page_key(post_id, version, path):
+    # Hash the path to keep keys short
+    path_hash = hashlib.md5(path.encode()).hexdigest()
+    return PAGE_KEY_TEMPLATE.format(post_id=post_id, version=version, path=path_hash)
+
+
+def get_page(post_id, version, path):
+    """Get a cached page of a post, or None on a miss."""
+    return get_cache().get(_page_key(post_id, version, path))
+
+
+def set_page(post_id, version, path, page):
+    """Store a rendered page of a post."""
+    get_cache().set(_page_key(post_id, version, path), page, timeout=get_timeout())
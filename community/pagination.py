@@ -0,0 +1,90 @@
+"""
+Keyset (cursor) pagination.
+
+Unlike OFFSET pagination, a keyset page is fetched with a range condition on
+an indexed ordering key, e.g. ``(created_at, id)``, so fetching the hundredth
+page costs the same as fetching the first. The cursor is an opaque token
+holding the key of the last row of the previous page.
+"""
+import base64
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class KeysetPage:
+    """
+    A page of results of keyset pagination.
+    """
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+def encode_cursor(values):
+    """
+    Encode the ordering key values of a row as a URL-safe cursor.
+    """
+    data = json.dumps([str(value) for value in values], separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, model, fields):
+    """
+    Decode a cursor into the ordering key values of ``fields`` of ``model``.
+    Returns None if the cursor is malformed.
+    """
+    try:
+        data = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(data)
+        if len(values) != len(fields):
+            return None
+        return [
+            model._meta.get_field(field).to_python(value)
+            for field, value in zip(fields, values)
+        ]
+    except (ValueError, TypeError, ValidationError):
+        return None
+
+
+def paginate_keyset(queryset, cursor=None, per_page=20, fields=('created_at', 'id'), descending=False):
+    """
+    Get the page of ``queryset`` following the row identified by ``cursor``.
+
+    The queryset is ordered by ``fields``, which must identify a row
+    uniquely and should be backed by an index. A missing or malformed cursor
+    returns the first page, like Paginator.get_page().
+    """
+    prefix = '-' if descending else ''
+    queryset = queryset.order_by(*(prefix + field for field in fields))
+
+    values = decode_cursor(cursor, queryset.model, fields) if cursor else None
+    if values is not None:
+        # Rows strictly after the cursor in the ordering: (a, b) > (x, y)
+        # is a > x OR (a = x AND b > y)
+        lookup = 'lt' if descending else 'gt'
+        condition = Q()
+        for i, field in enumerate(fields):
+            equal = {name: value for name, value in zip(fields[:i], values[:i])}
+            condition |= Q(**equal, **{f'{field}__{lookup}': values[i]})
+        queryset = queryset.filter(condition)
+
+    rows = list(queryset[:per_page + 1])
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor([getattr(last, field) for field in fields])
+    return KeysetPage(rows, next_cursor)
@@ -0,0 +1,23 @@
+"""
+Rendering of post and comment text to HTML.
+
+This module imports no models, so the worker processes of the
+render_content_html command can import it without setting up Django,
+whatever the multiprocessing start method.
+"""
+from django.utils.html import linebreaks
+
+
+def render_content(content):
+    """
+    Render the text of a post or comment to HTML, like the linebreaks
+    template filter with autoescaping.
+    """
+    return linebreaks(content, autoescape=True)
+
+
+def render_chunk(rows):
+    """
+    Render a chunk of (pk, content) rows to (pk, HTML) pairs.
+    """
+    return [(pk, render_content(content)) for pk, content in rows]
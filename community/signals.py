@@ -0,0 +1,24 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from . import page_cache
+from .models import Post, Comment, Media
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def invalidate_post_page(sender, instance, **kwargs):
+    """
+    Signal to invalidate the cached pages of a post when it changes.
+    """
+    page_cache.bump_post_version(instance.pk)
+
+@receiver(post_save, sender=Comment)
+@receiver(post_delete, sender=Comment)
+@receiver(post_save, sender=Media)
+@receiver(post_delete, sender=Media)
+def invalidate_parent_post_page(sender, instance, **kwargs):
+    """
+    Signal to invalidate the cached pages of a post when one of its comments
+    or media changes.
+    """
+    page_cache.bump_post_version(instance.post_id)
@@ -16,3 +16,421 @@ def test_authenticated_access(client, create_user):
     assert response.status_code == 200
     assert 'user' in response.context
     assert response.context['user'].is_authenticated
+
+# Test toggling likes keeps the denormalized like counts in step
+@pytest.mark.django_db
+def test_toggle_like_updates_like_count(client, create_user, create_post):
+    from io import StringIO
+    from django.core.management import call_command
+    from community.models import Comment, Post
+
+    comment = Comment.objects.create(post=create_post, author=create_user, content='First!')
+    assert create_post.toggle_like(create_user) is True
+    assert create_post.like_count == 1
+    assert comment.toggle_like(create_user) is True
+    assert comment.toggle_like(create_user) is False
+    assert Comment.objects.get(pk=comment.pk).like_count == 0
+
+    client.force_login(create_user)
+    response = client.post(
+        reverse('community:post_like_toggle', kwargs={'post_id': create_post.pk}),
+        HTTP_X_REQUESTED_WITH='XMLHttpRequest',
+    )
+    assert response.json() == {'success': True, 'is_liked': False, 'like_count': 0}
+
+    # Drift introduced behind the model's back is repaired in bulk
+    Post.objects.filter(pk=create_post.pk).update(like_count=7)
+    out = StringIO()
+    call_command('reconcile_like_counts', stdout=out)
+    assert 'Repaired like counts of 1 posts' in out.getvalue()
+    assert Post.objects.get(pk=create_post.pk).like_count == 0
+
+# Test the like status of all comments on a post is looked up in one query
+@pytest.mark.django_db
+def test_comment_like_status_single_query(create_user, create_post, django_assert_num_queries):
+    from django.contrib.contenttypes.models import ContentType
+    from community.models import Comment
+
+    comments = [
+        Comment.objects.create(post=create_post, author=create_user, content=f'Comment {i}')
+        for i in range(5)
+    ]
+    comments.append(Comment.objects.create(post=create_post, author=create_user, content='Reply', parent=comments[0]))
+    comments[1].toggle_like(create_user)
+    comments[-1].toggle_like(create_user)
+
+    ContentType.objects.get_for_model(Comment)
+    with django_assert_num_queries(1):
+        liked_ids = Comment.get_liked_ids(create_user, create_post.comments.values('pk'))
+    assert liked_ids == {comments[1].pk, comments[-1].pk}
+
+# Test a like that loses a race against a concurrent like does not error or double count
+@pytest.mark.django_db
+def test_toggle_like_concurrent_insert(client, create_user, create_post, django_assert_max_num_queries):
+    from unittest import mock
+    from django.db.models import QuerySet
+    from community.models import Post
+
+    client.force_login(create_user)
+    url = reverse('community:post_like_toggle', kwargs={'post_id': create_post.pk})
+    response = client.post(url, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+    assert response.json()['like_count'] == 1
+
+    # The concurrent request's like is invisible to the delete, so the insert collides
+    post = Post.objects.get(pk=create_post.pk)
+    with mock.patch.object(QuerySet, 'delete', return_value=(0, {})):
+        assert post.toggle_like(create_user) is True
+    assert Post.objects.get(pk=create_post.pk).like_count == 1
+
+    # Savepoint, delete, counter update and release; the count is not read back
+    post = Post.objects.get(pk=create_post.pk)
+    with django_assert_max_num_queries(4):
+        assert post.toggle_like(create_user) is False
+    assert post.like_count == 0
+
+# Test the write-behind buffer answers optimistically and writes only net changes
+@pytest.mark.django_db
+def test_like_buffer_flushes_net_changes(create_user, create_post):
+    from django.contrib.auth import get_user_model
+    from community.like_buffer import LikeBuffer
+    from community.models import Like, Post
+
+    other = get_user_model().objects.create_user(username='other', email='other@example.com', password='testpassword123')
+    create_post.toggle_like(other)
+    buffer = LikeBuffer(max_size=100, flush_interval=3600)
+
+    post = Post.objects.get(pk=create_post.pk)
+    assert buffer.toggle(post, create_user) is True
+    assert post.like_count == 2
+    for expected in (False, True, False):
+        post = Post.objects.get(pk=create_post.pk)
+        assert buffer.toggle(post, other) is expected
+    assert post.like_count == 1
+    assert len(buffer) == 2
+    assert Like.objects.count() == 1
+
+    assert buffer.flush() == 2
+    assert list(Like.objects.values_list('user', flat=True)) == [create_user.pk]
+    assert Post.objects.get(pk=create_post.pk).like_count == 1
+    assert buffer.flush() == 0
+
+# Test a toggle made while its pair is being flushed starts from the flushed state
+@pytest.mark.django_db
+def test_like_buffer_toggle_during_flush(create_user, create_post, monkeypatch):
+    from community.like_buffer import LikeBuffer
+    from community.models import Like, Post
+
+    buffer = LikeBuffer(max_size=100, flush_interval=3600)
+    assert buffer.toggle(Post.objects.get(pk=create_post.pk), create_user) is True
+
+    bulk_create = Like.objects.bulk_create
+    toggled = []
+
+    def toggle_then_bulk_create(*args, **kwargs):
+        # Unlike before the flush has written the like
+        post = Post.objects.get(pk=create_post.pk)
+        toggled.append((buffer.toggle(post, create_user), post.like_count))
+        return bulk_create(*args, **kwargs)
+
+    monkeypatch.setattr(Like.objects, 'bulk_create', toggle_then_bulk_create)
+    assert buffer.flush() == 1
+    assert toggled == [(False, 0)]
+    assert Like.objects.count() == 1
+
+    monkeypatch.setattr(Like.objects, 'bulk_create', bulk_create)
+    assert buffer.flush() == 1
+    assert Like.objects.count() == 0
+    assert Post.objects.get(pk=create_post.pk).like_count == 0
+
+# Test liked content is paginated by cursor with a fixed number of queries per page
+@pytest.mark.django_db
+def test_liked_content_keyset_pagination(client, create_user, create_post, django_assert_num_queries, monkeypatch):
+    from community import views
+    from community.models import Comment, Post
+
+    posts = [create_post] + [
+        Post.objects.create(title=f'Post {i}', content='Content', board=create_post.board, author=create_user)
+        for i in range(3)
+    ]
+    comments = [Comment.objects.create(post=create_post, author=create_user, content=f'Comment {i}') for i in range(2)]
+    for obj in posts + comments:
+        obj.toggle_like(create_user)
+    Post.objects.filter(pk=posts[1].pk).delete()
+
+    client.force_login(create_user)
+    url = reverse('community:liked_content_json')
+    monkeypatch.setattr(views, 'LIKED_CONTENT_PAGE_SIZE', 3)
+    client.get(url)
+    # Session, user, likes page, posts, comments
+    with django_assert_num_queries(5):
+        first = client.get(url).json()
+    second = client.get(url, {'cursor': first['next_cursor']}).json()
+
+    assert [item['id'] for item in first['results']] == [comments[1].pk, comments[0].pk, posts[3].pk]
+    assert first['has_more'] is True
+    # The likes of the deleted post are gone with it
+    assert [item['id'] for item in second['results']] == [posts[2].pk, posts[0].pk]
+    assert second['has_more'] is False
+
+    response = client.get(reverse('community:liked_content'))
+    assert response.status_code == 200
+
+# Test the post detail page runs the same number of queries regardless of thread size
+@pytest.mark.django_db
+def test_post_detail_constant_queries(client, create_user, create_post, monkeypatch):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from community.models import Comment
+    from community import view_counter
+    from community.view_counter import ViewCountBuffer
+
+    monkeypatch.setattr(view_counter, '_buffer', ViewCountBuffer(flush_interval=3600))
+
+    client.force_login(create_user)
+    url = reverse('community:post_detail', kwargs={'pk': create_post.pk})
+
+    def add_thread(size):
+        for i in range(size):
+            comment = Comment.objects.create(post=create_post, author=create_user, content=f'Comment {i}')
+            Comment.objects.create(post=create_post, author=create_user, content=f'Reply {i}', parent=comment)
+
+    def count_queries():
+        with CaptureQueriesContext(connection) as context:
+            response = client.get(url)
+        assert response.status_code == 200
+        return len(context)
+
+    add_thread(1)
+    client.get(url)
+    # Session, user, validators, post, media, top-level comments, replies,
+    # comment count, post like, comment likes
+    assert count_queries() == 10
+    add_thread(20)
+    assert count_queries() == 10
+    assert len(client.get(url).context['comments']) == 21
+
+# Test comments of any depth are ordered by materialized path and subtrees are fetched by prefix
+@pytest.mark.django_db
+def test_comment_materialized_path(client, create_user, create_post):
+    from io import StringIO
+    from django.core.management import call_command
+    from community.models import Comment
+
+    first = Comment.objects.create(post=create_post, author=create_user, content='First')
+    second = Comment.objects.create(post=create_post, author=create_user, content='Second')
+    reply = Comment.objects.create(post=create_post, author=create_user, content='Reply', parent=first)
+    nested = Comment.objects.create(post=create_post, author=create_user, content='Nested', parent=reply)
+    late_reply = Comment.objects.create(post=create_post, author=create_user, content='Late reply', parent=first)
+
+    assert nested.depth == 2
+    assert nested.path.startswith(reply.path + '.')
+    thread = list(create_post.comments.order_by('path'))
+    assert thread == [first, reply, nested, late_reply, second]
+    assert list(first.get_subtree()) == [first, reply, nested, late_reply]
+
+    # The page renders nested replies below their parents
+    response = client.get(reverse('community:post_detail', kwargs={'pk': create_post.pk}))
+    assert response.context['comments'] == [first, second]
+    assert response.context['comments'][0].thread_replies[0].thread_replies == [nested]
+    assert b'id="comment-%d"' % nested.pk in response.content
+
+    Comment.objects.update(path='', depth=0)
+    call_command('rebuild_comment_paths', stdout=StringIO())
+    assert list(create_post.comments.order_by('path')) == thread
+    assert Comment.objects.get(pk=nested.pk).depth == 2
+
+# Test top-level comments are paginated by cursor with their replies
+@pytest.mark.django_db
+def test_comment_keyset_pagination(client, create_user, create_post, monkeypatch):
+    from community import views
+    from community.models import Comment
+
+    monkeypatch.setattr(views, 'COMMENT_PAGE_SIZE', 2)
+    roots = [Comment.objects.create(post=create_post, author=create_user, content=f'Comment {i}') for i in range(5)]
+    reply = Comment.objects.create(post=create_post, author=create_user, content='Reply', parent=roots[2])
+    nested = Comment.objects.create(post=create_post, author=create_user, content='Nested', parent=reply)
+
+    response = client.get(reverse('community:post_detail', kwargs={'pk': create_post.pk}))
+    assert response.context['comments'] == roots[:2]
+    cursor = response.context['next_comment_cursor']
+
+    url = reverse('community:comment_page', kwargs={'post_id': create_post.pk})
+    page = client.get(url, {'cursor': cursor}).json()
+    assert page['has_more'] is True
+    for comment in (roots[2], roots[3], reply, nested):
+        assert f'id="comment-{comment.pk}"' in page['html']
+    assert f'id="comment-{roots[4].pk}"' not in page['html']
+
+    page = client.get(url, {'cursor': page['next_cursor']}).json()
+    assert page['has_more'] is False
+    assert f'id="comment-{roots[4].pk}"' in page['html']
+
+# Test post views are deduplicated per viewer and written in bulk
+@pytest.mark.django_db
+def test_post_views_buffered_and_deduplicated(client, create_user, create_post, django_assert_num_queries, monkeypatch):
+    from django.test import Client
+    from community.models import Post
+    from community import view_counter
+    from community.view_counter import ViewCountBuffer
+
+    buffer = ViewCountBuffer(flush_interval=3600)
+    monkeypatch.setattr(view_counter, '_buffer', buffer)
+    url = reverse('community:post_detail', kwargs={'pk': create_post.pk})
+    client.get(url)
+    client.get(url)
+    Client(REMOTE_ADDR='10.0.0.2').get(url)
+    client.force_login(create_user)
+    response = client.get(url)
+    assert response.context['post'].view_count == 3
+    assert Post.objects.get(pk=create_post.pk).view_count == 0
+
+    buffer.flush()
+    assert Post.objects.get(pk=create_post.pk).view_count == 3
+
+    # Posts with the same number of new views share one UPDATE
+    other = Post.objects.create(title='Other', content='Content', board=create_post.board, author=create_user)
+    buffer = ViewCountBuffer()
+    for post_id in (create_post.pk, other.pk, other.pk):
+        buffer.record(post_id)
+    buffer.record(create_post.pk)
+    with django_assert_num_queries(1):
+        buffer.flush()
+    assert Post.objects.get(pk=other.pk).view_count == 2
+
+# Test unique viewers are estimated from daily HyperLogLog sketches of posts and boards
+@pytest.mark.django_db
+def test_viewer_sketches(client, create_user, create_post, monkeypatch):
+    from datetime import timedelta
+    from django.test import Client
+    from django.utils import timezone
+    from community import view_counter
+    from community.hyperloglog import HyperLogLog
+    from community.models import BoardViewerSketch, Post, PostViewerSketch
+    from community.view_counter import ViewCountBuffer
+
+    sketch = HyperLogLog()
+    for i in range(20000):
+        sketch.add(f'user:{i % 10000}')
+    assert abs(sketch.count() - 10000) < 500
+    assert len(sketch.to_bytes()) == 4096
+
+    buffer = ViewCountBuffer(flush_interval=3600)
+    monkeypatch.setattr(view_counter, '_buffer', buffer)
+    other = Post.objects.create(title='Other', content='Content', board=create_post.board, author=create_user)
+    for address in ('10.0.0.1', '10.0.0.2', '10.0.0.3'):
+        Client(REMOTE_ADDR=address).get(reverse('community:post_detail', kwargs={'pk': create_post.pk}))
+    Client(REMOTE_ADDR='10.0.0.1').get(reverse('community:post_detail', kwargs={'pk': other.pk}))
+    buffer.flush()
+    # Sketches of later flushes are merged into the same daily rows
+    Client(REMOTE_ADDR='10.0.0.4').get(reverse('community:post_detail', kwargs={'pk': other.pk}))
+    buffer.flush()
+
+    assert PostViewerSketch.objects.count() == 2
+    assert PostViewerSketch.estimate_viewers(create_post) == 3
+    assert PostViewerSketch.estimate_viewers(other) == 2
+    assert BoardViewerSketch.estimate_viewers(create_post.board) == 4
+
+    # A repeat view within the deduplication window is not counted, but its
+    # viewer still appears in the sketches of a new day
+    tomorrow = timezone.localdate() + timedelta(days=1)
+    monkeypatch.setattr(view_counter.timezone, 'localdate', lambda: tomorrow)
+    Client(REMOTE_ADDR='10.0.0.1').get(reverse('community:post_detail', kwargs={'pk': create_post.pk}))
+    assert buffer.pending(create_post.pk) == 0
+    buffer.flush()
+    assert PostViewerSketch.estimate_viewers(create_post, since=tomorrow) == 1
+    assert BoardViewerSketch.estimate_viewers(create_post.board, since=tomorrow) == 1
+
+# Test post and comment HTML is rendered on save and backfilled by the command
+@pytest.mark.django_db
+def test_content_html_rendered_on_save(client, create_user, create_post, monkeypatch):
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+    from functools import partial
+    from io import StringIO
+    from django.core.management import call_command
+    from community.management.commands import render_content_html
+    from community.models import Comment, Post
+
+    comment = Comment.objects.create(post=create_post, author=create_user, content='<b>Hi</b>\n\nthere')
+    assert comment.content_html == '<p>&lt;b&gt;Hi&lt;/b&gt;</p>\n\n<p>there</p>'
+    create_post.content = 'Line one\nLine two'
+    create_post.save(update_fields=['content'])
+    assert Post.objects.get(pk=create_post.pk).content_html == '<p>Line one<br>Line two</p>'
+
+    response = client.get(reverse('community:post_detail', kwargs={'pk': create_post.pk}))
+    assert b'<p>&lt;b&gt;Hi&lt;/b&gt;</p>' in response.content
+
+    Post.objects.update(content_html='')
+    Comment.objects.update(content_html='')
+    # Workers started without forking must not need Django set up
+    monkeypatch.setattr(render_content_html, 'ProcessPoolExecutor', partial(
+        ProcessPoolExecutor, mp_context=multiprocessing.get_context('spawn')
+    ))
+    out = StringIO()
+    call_command('render_content_html', '--workers', '2', '--batch-size', '1', stdout=out)
+    assert 'Rendered HTML of 1 posts' in out.getvalue()
+    assert Comment.objects.get(pk=comment.pk).content_html == comment.content_html
+
+# Test anonymous post pages are cached until the thread changes and revalidate with 304
+@pytest.mark.django_db
+def test_post_page_cache_and_conditional_get(client, create_user, create_post, monkeypatch,
+                                             django_capture_on_commit_callbacks):
+    import time
+    from datetime import timedelta
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+    from django.utils import timezone
+    from community.models import Comment, Post
+    from community import page_cache, view_counter
+    from community.view_counter import ViewCountBuffer
+
+    buffer = ViewCountBuffer(flush_interval=3600)
+    monkeypatch.setattr(view_counter, '_buffer', buffer)
+    url = reverse('community:post_detail', kwargs={'pk': create_post.pk})
+    # The post last changed a minute ago
+    Post.objects.filter(pk=create_post.pk).update(updated_at=timezone.now() - timedelta(minutes=1))
+    page_cache.get_cache().set(
+        page_cache.MODIFIED_KEY_TEMPLATE.format(post_id=create_post.pk), time.time() - 60, timeout=None
+    )
+
+    first = client.get(url)
+    assert first.status_code == 200
+    with CaptureQueriesContext(connection) as context:
+        cached = client.get(url)
+    # Only the post is read, for its modification time and board
+    assert len(context) == 1
+    assert cached.content == first.content
+    assert cached['ETag'] == first['ETag']
+    # Query strings are served the page of the path
+    with CaptureQueriesContext(connection) as context:
+        assert client.get(url, {'x': '1'}).content == first.content
+    assert len(context) == 1
+    assert b'csrfmiddlewaretoken' not in first.content
+
+    assert client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code == 304
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code == 304
+    # Views served from the cache or revalidated are still counted, once per viewer
+    assert buffer.pending(create_post.pk) == 1
+
+    # Likes only change the like count, but still update the validators
+    with django_capture_on_commit_callbacks(execute=True):
+        create_post.toggle_like(create_user)
+    assert client.get(url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code == 200
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Comment.objects.create(post=create_post, author=create_user, content='Fresh comment')
+    assert client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code == 200
+    assert b'Fresh comment' in client.get(url).content
+
+    # Signed-in readers get their own validators, bound to their session, and
+    # are never served cached pages
+    client.force_login(create_user)
+    client.get(url)  # Sets the CSRF cookie
+    response = client.get(url)
+    assert response['ETag'] != first['ETag']
+    assert not response.has_header('Last-Modified')
+    assert b'csrfmiddlewaretoken' in response.content
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 304
+    client.logout()
+    client.force_login(create_user)
+    assert client.get(url, HTTP_IF_NONE_MATCH=response['ETag']).status_code == 200
@@ -31,6 +31,7 @@ urlpatterns = [
 
     # Comment URLs
     path('post/<int:post_id>/comment/', views.comment_create, name='comment_create'),
+    path('post/<int:post_id>/comments/', views.comment_page, name='comment_page'),
     path('comment/<int:comment_id>/update/', views.comment_update, name='comment_update'),
     path('comment/<int:comment_id>/delete/', views.comment_delete, name='comment_delete'),
 
@@ -41,4 +42,6 @@ urlpatterns = [
     # Like URLs
     path('post/<int:post_id>/like/', views.post_like_toggle, name='post_like_toggle'),
     path('comment/<int:comment_id>/like/', views.comment_like_toggle, name='comment_like_toggle'),
+    path('likes/', views.liked_content, name='liked_content'),
+    path('likes/json/', views.liked_content_json, name='liked_content_json'),
 ]
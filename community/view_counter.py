@@ -0,0 +1,143 @@
+"""
+Buffered, deduplicated post view counting.
+
+A post view is counted once per viewer and POST_VIEW_DEDUP_WINDOW seconds,
+tracked with cache.add() in the default cache. Counted views are kept in a
+per-process ViewCountBuffer and written every POST_VIEW_FLUSH_INTERVAL
+seconds, or when POST_VIEW_BUFFER_SIZE posts are pending, with one
+``UPDATE ... SET view_count = view_count + n`` per distinct n, so reading a
+post does not write to the database.
+
+The buffer also adds the viewer of every view, counted or not, to a
+HyperLogLog sketch of the post and of its board, which are merged into the
+daily viewer sketches on flush; adding a viewer twice is harmless, and a
+repeat view within the window may fall on a new day.
+"""
+import atexit
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+from django.utils import timezone
+
+from .hyperloglog import HyperLogLog
+
+
+class ViewCountBuffer:
+    """
+    Per-process buffer of post view increments.
+    """
+
+    def __init__(self, max_entries=1000, flush_interval=30):
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        # {post id: views not yet written}
+        self._counts = {}
+        # {post id: sketch}, {board id: sketch} of viewers not yet written
+        self._post_sketches = {}
+        self._board_sketches = {}
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self._counts)
+
+    def record(self, post_id, board_id=None, viewer=None, counted=True):
+        """
+        Record one view of a post, adding the viewer, if given, to the
+        sketches. The view is only counted if ``counted`` is true.
+        """
+        with self._lock:
+            if counted:
+                self._counts[post_id] = self._counts.get(post_id, 0) + 1
+            if viewer is not None:
+                self._post_sketches.setdefault(post_id, HyperLogLog()).add(viewer)
+                if board_id is not None:
+                    self._board_sketches.setdefault(board_id, HyperLogLog()).add(viewer)
+
+    def pending(self, post_id):
+        """Get the number of views of a post not yet written."""
+        return self._counts.get(post_id, 0)
+
+    def flush_if_due(self):
+        """Flush the buffer if it is full or the flush interval has elapsed."""
+        if (len(self._counts) >= self.max_entries or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Add the buffered views to the view counts of the posts and merge
+        the viewer sketches into today's sketches.
+
+        Posts with the same number of new views are updated together with
+        a single UPDATE.
+        """
+        from .models import BoardViewerSketch, Post, PostViewerSketch
+
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            post_sketches, self._post_sketches = self._post_sketches, {}
+            board_sketches, self._board_sketches = self._board_sketches, {}
+            self._last_flush = time.monotonic()
+        if not counts and not post_sketches:
+            return
+
+        today = timezone.localdate()
+        PostViewerSketch.merge_sketches(today, post_sketches)
+        BoardViewerSketch.merge_sketches(today, board_sketches)
+
+        groups = {}
+        for post_id, views in counts.items():
+            groups.setdefault(views, []).append(post_id)
+        for views, post_ids in groups.items():
+            Post.objects.filter(pk__in=post_ids).update(view_count=F('view_count') + views)
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_view_buffer():
+    """
+    Get the view count buffer of this process, configured from the settings.
+    """
+    global _buffer
+    with _buffer_lock:
+        if _buffer is None:
+            _buffer = ViewCountBuffer(
+                max_entries=getattr(settings, 'POST_VIEW_BUFFER_SIZE', 1000),
+                flush_interval=getattr(settings, 'POST_VIEW_FLUSH_INTERVAL', 30),
+            )
+            atexit.register(_buffer.flush)
+        return _buffer
+
+
+def get_viewer_key(request):
+    """
+    Identify the viewer of a request: the user, else the session, else the
+    client address and user agent. No session is created for the purpose.
+    """
+    if request.user.is_authenticated:
+        return f'user:{request.user.pk}'
+    if request.session.session_key:
+        return f'session:{request.session.session_key}'
+    client = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return 'client:' + hashlib.sha1(client.encode()).hexdigest()
+
+
+def record_post_view(request, post):
+    """
+    Record a view of a post, counting it unless the viewer viewed the post
+    within the deduplication window. Returns True if the view was counted.
+    """
+    window = getattr(settings, 'POST_VIEW_DEDUP_WINDOW', 1800)
+    viewer = get_viewer_key(request)
+    counted = cache.add(f'post_views:seen:{post.pk}:{viewer}', True, timeout=window)
+    buffer = get_view_buffer()
+    buffer.record(post.pk, board_id=post.board_id, viewer=viewer, counted=counted)
+    buffer.flush_if_due()
+    return counted
@@ -1,16 +1,24 @@
 from django.shortcuts import render, get_object_or_404, redirect
+from django.template.loader import render_to_string
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView
 from django.urls import reverse_lazy, reverse
 from django.utils.decorators import method_decorator
 from django.db.models import Q
-from django.http import JsonResponse, HttpResponseForbidden
+from django.http import Http404, HttpResponse, JsonResponse, HttpResponseForbidden
 from django.views.decorators.http import require_POST
 from django.core.paginator import Paginator
+from django.utils.cache import get_conditional_response
+from django.utils.crypto import salted_hmac
+from django.utils.http import http_date
+from django.utils.text import Truncator
 
 from .models import Category, Board, Report, Notice, FAQ, Post, Comment, Media, Like
 from .forms import ReportForm, PostForm, CommentForm, MediaForm, PostWithMediaForm
+from . import page_cache
+from .pagination import paginate_keyset
+from .view_counter import get_view_buffer, record_post_view
 
 class CategoryListView(ListView):
     """
@@ -209,6 +217,72 @@ class PostWithMediaCreateView(CreateView):
         return redirect('community:post_detail', pk=post.pk)
 
 
+def build_comment_tree(comments):
+    """
+    Attach the replies of each comment, at any depth, as ``thread_replies``.
+
+    Every comment must follow its parent in ``comments``, as in path order.
+    Returns the comments whose parent is not among ``comments``.
+    """
+    by_id = {}
+    roots = []
+    for comment in comments:
+        comment.thread_replies = []
+        parent = by_id.get(comment.parent_id)
+        if parent is None:
+            roots.append(comment)
+        else:
+            parent.thread_replies.append(comment)
+        by_id[comment.id] = comment
+    return roots
+
+
+COMMENT_PAGE_SIZE = 50
+
+
+def get_comment_page(post, cursor=None):
+    """
+    Get a page of the top-level comments of a post with all their replies.
+
+    Top-level comments are paginated by a keyset cursor over
+    (created_at, id), backed by the (post, parent, created_at) index, so
+    every page costs the same. The replies of the page are loaded with one
+    range query on the (post, path) index covering the page's subtrees.
+    Returns the top-level comments and the cursor of the next page.
+    """
+    page = paginate_keyset(
+        post.comments.filter(parent=None).select_related('author'),
+        cursor=cursor,
+        per_page=COMMENT_PAGE_SIZE,
+    )
+    roots = page.object_list
+    if not roots:
+        return roots, page.next_cursor
+
+    paths = sorted(comment.path for comment in roots)
+    root_paths = set(paths)
+    replies = [
+        reply for reply in post.comments.filter(
+            depth__gt=0,
+            path__gt=paths[0],
+            path__lt=paths[-1] + Comment.PATH_END,
+        ).select_related('author').order_by('path')
+        # Skip subtrees of top-level comments on other pages
+        if reply.path[:Comment.PATH_SEGMENT_WIDTH] in root_paths
+    ]
+    build_comment_tree(roots + replies)
+    return roots, page.next_cursor
+
+
+def get_comment_like_status(user, post):
+    """
+    Get a {comment ID: True} dict of the comments on a post liked by the user.
+    """
+    # One query for every comment and reply of the post
+    liked_ids = Comment.get_liked_ids(user, post.comments.values('pk'))
+    return dict.fromkeys(liked_ids, True)
+
+
 class PostDetailView(DetailView):
     """
     View for displaying a specific post and its comments.
@@ -217,15 +291,71 @@ class PostDetailView(DetailView):
     template_name = 'community/post_detail.html'
     context_object_name = 'post'
 
+    def get_queryset(self):
+        return Post.objects.select_related('board', 'author').prefetch_related('media')
+
+    def get(self, request, *args, **kwargs):
+        # Pages showing messages are neither validated nor cached
+        if len(messages.get_messages(request)):
+            return super().get(request, *args, **kwargs)
+
+        post = Post.objects.filter(pk=kwargs['pk']).only('pk', 'board_id', 'updated_at').first()
+        if post is None:
+            raise Http404('No post found matching the query')
+
+        # The page changes with the post, its comments, media and likes,
+        # which all bump the post's page version and modification time
+        version, modified = page_cache.get_post_validators(post.pk)
+        last_modified = max(post.updated_at, modified)
+        if request.user.is_authenticated:
+            # The page embeds CSRF tokens, which are only valid for the
+            # session and CSRF secret they were rendered for; a modification
+            # time cannot tell those apart, so only the ETag is emitted
+            reader = f"{request.user.pk}:{request.session.session_key}:{request.META.get('CSRF_COOKIE', '')}"
+            timestamp = None
+        else:
+            reader = 'anonymous'
+            timestamp = int(last_modified.timestamp())
+        etag = '"%s"' % salted_hmac(
+            'community.post_page', f'{post.pk}:{version}:{last_modified.isoformat()}:{reader}'
+        ).hexdigest()
+
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None and not request.user.is_authenticated:
+            # The page reads no query parameters, so query strings share
+            # the page of the path instead of filling the cache
+            page = page_cache.get_page(post.pk, version, request.path)
+            if page is not None:
+                response = HttpResponse(page['content'], content_type=page['content_type'])
+        if response is not None:
+            # Served without rendering, but still a view of the post
+            record_post_view(request, post)
+        else:
+            response = super().get(request, *args, **kwargs)
+            response.render()
+            if not request.user.is_authenticated and response.status_code == 200:
+                page_cache.set_page(post.pk, version, request.path, {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                })
+
+        response['ETag'] = etag
+        if timestamp is not None:
+            response['Last-Modified'] = http_date(timestamp)
+        return response
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Increment view count
-        self.object.view_count += 1
-        self.object.save(update_fields=['view_count'])
+        # Count the view; the count is written later in bulk, so show the
+        # stored count plus the views not yet written
+        record_post_view(self.request, self.object)
+        self.object.view_count += get_view_buffer().pending(self.object.pk)
 
-        # Get comments with pagination
-        comments = self.object.comments.filter(parent=None).order_by('created_at')
+        # Load the first page of comments; later pages are fetched by cursor
+        comments, next_cursor = get_comment_page(self.object)
         context['comments'] = comments
+        context['next_comment_cursor'] = next_cursor
+        context['comment_count'] = self.object.comments.count()
         context['comment_form'] = CommentForm()
         context['media_form'] = MediaForm()
 
@@ -233,18 +363,30 @@ class PostDetailView(DetailView):
         user = self.request.user
         if user.is_authenticated:
             context['is_post_liked'] = self.object.is_liked_by(user)
-            # Add like status for each comment
-            comment_like_status = {}
-            for comment in comments:
-                comment_like_status[comment.id] = comment.is_liked_by(user)
-                # Also check replies
-                for reply in comment.replies.all():
-                    comment_like_status[reply.id] = reply.is_liked_by(user)
-            context['comment_like_status'] = comment_like_status
+            context['comment_like_status'] = get_comment_like_status(user, self.object)
 
         return context
 
 
+def comment_page(request, post_id):
+    """
+    View for fetching the next page of comments of a post as rendered HTML.
+    """
+    post = get_object_or_404(Post, id=post_id)
+    comments, next_cursor = get_comment_page(post, request.GET.get('cursor'))
+    html = render_to_string('community/comment_list.html', {
+        'post': post,
+        'comments': comments,
+        'continued': True,
+        'comment_like_status': get_comment_like_status(request.user, post),
+    }, request=request)
+    return JsonResponse({
+        'html': html,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    })
+
+
 @method_decorator(login_required, name='dispatch')
 class PostUpdateView(UpdateView):
     """
@@ -302,7 +444,7 @@ def comment_create(request, post_id):
         # Check if this is a reply to another comment
         parent_id = request.POST.get('parent_id')
         if parent_id:
-            parent = get_object_or_404(Comment, id=parent_id)
+            parent = get_object_or_404(Comment, id=parent_id, post=post)
             comment.parent = parent
 
         comment.save()
@@ -417,7 +559,7 @@ def post_like_toggle(request, post_id):
         return JsonResponse({
             'success': True,
             'is_liked': is_liked,
-            'like_count': post.get_like_count()
+            'like_count': post.like_count
         })
 
     # Otherwise redirect back to the post detail page
@@ -439,8 +581,79 @@ def comment_like_toggle(request, comment_id):
         return JsonResponse({
             'success': True,
             'is_liked': is_liked,
-            'like_count': comment.get_like_count()
+            'like_count': comment.like_count
         })
 
     # Otherwise redirect back to the post detail page
     return redirect('community:post_detail', pk=post_id)
+
+
+LIKED_CONTENT_PAGE_SIZE = 20
+
+
+def get_liked_content_page(request):
+    """
+    Get a page of the content liked by the current user, newest first.
+
+    Likes are paginated by a keyset cursor over (created_at, id), backed by
+    the (user, -created_at, -id) index of Like, and the liked posts and
+    comments are loaded with one query per content type.
+    """
+    page = paginate_keyset(
+        request.user.likes.all(),
+        cursor=request.GET.get('cursor'),
+        per_page=LIKED_CONTENT_PAGE_SIZE,
+        descending=True,
+    )
+    likes = Like.load_content_objects(page.object_list, querysets={
+        Post: Post.objects.select_related('board'),
+        Comment: Comment.objects.select_related('post'),
+    })
+
+    items = []
+    for like in likes:
+        obj = like.content_object
+        if isinstance(obj, Post):
+            items.append({
+                'type': 'post',
+                'id': obj.id,
+                'title': obj.title,
+                'excerpt': Truncator(obj.content).chars(200),
+                'url': reverse('community:post_detail', kwargs={'pk': obj.id}),
+                'liked_at': like.created_at,
+            })
+        elif isinstance(obj, Comment):
+            items.append({
+                'type': 'comment',
+                'id': obj.id,
+                'title': obj.post.title,
+                'excerpt': Truncator(obj.content).chars(200),
+                'url': reverse('community:post_detail', kwargs={'pk': obj.post_id}) + f'#comment-{obj.id}',
+                'liked_at': like.created_at,
+            })
+    return items, page.next_cursor
+
+
+@login_required
+def liked_content(request):
+    """
+    View for listing the content liked by the current user.
+    """
+    items, next_cursor = get_liked_content_page(request)
+    return render(request, 'community/liked_content.html', {
+        'items': items,
+        'next_cursor': next_cursor,
+    })
+
+
+@login_required
+def liked_content_json(request):
+    """
+    View for fetching a page of the content liked by the current user as JSON.
+    """
+    items, next_cursor = get_liked_content_page(request)
+    return JsonResponse({
+        'results': items,
+        'next_cursor': next_cursor,
+        'has_more': next_cursor is not None,
+    })
@@ -46,6 +46,7 @@ MIDDLEWARE = [
     'users.middleware.PermissionTrackingMiddleware',
     'users.middleware.PermissionAuditMiddleware',
     'users.middleware.LeastPrivilegeMiddleware',
+    'users.middleware.TemporaryRoleExpiryMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -60,6 +61,7 @@ TEMPLATES = [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
+                'users.context_processors.authorization',
             ],
         },
     },
@@ -133,9 +135,37 @@ LOGIN_URL = 'users:login'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_REDIRECT_URL = 'home'
 
+# Cache configuration
+# Local memory by default; environments with several worker processes should
+# use a shared backend (see production.py)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'community-default',
+    },
+}
+
 # Permission system settings
 PERMISSION_DENIED_THRESHOLD = 5  # Number of permission denials before logging a warning
 PERMISSION_REVIEW_DAYS = 30  # Number of days between permission reviews
+PERMISSION_TRACKING_SAMPLE_RATE = 1.0  # Fraction of requests whose permission checks are logged one by one (0 disables)
+PERMISSION_USAGE_BUFFER_SIZE = 1000  # Usage counters buffered per worker before a flush
+PERMISSION_USAGE_FLUSH_INTERVAL = 60  # Seconds between flushes of usage counters
+TEMPORARY_ROLE_SWEEP_INTERVAL = 300  # Seconds between in-process sweeps of expired roles (0 disables)
+PERMISSION_CACHE_ALIAS = 'default'  # Cache holding resolved user roles and permissions
+PERMISSION_CACHE_TIMEOUT = 300  # Lifetime in seconds of a cached user authorization
+
+# Like settings
+LIKE_WRITE_BEHIND = False  # Buffer like toggles in each worker and write them in batches
+LIKE_BUFFER_MAX_SIZE = 1000  # Buffered like toggles per worker before a flush
+LIKE_BUFFER_FLUSH_INTERVAL = 5  # Seconds a buffered like toggle may wait; the most lost on a crash
+
+# Post view count settings
+POST_VIEW_DEDUP_WINDOW = 1800  # Seconds during which repeat views of a post by the same viewer are not counted
+POST_VIEW_BUFFER_SIZE = 1000  # Posts with buffered views per worker before a flush
+POST_VIEW_FLUSH_INTERVAL = 30  # Seconds between flushes of buffered view counts
+POST_PAGE_CACHE_ALIAS = 'default'  # Cache holding post pages rendered for anonymous readers
+POST_PAGE_CACHE_TIMEOUT = 300  # Lifetime in seconds of a cached post page
 
 # Logging configuration
 LOGGING = {
@@ -158,9 +188,15 @@ LOGGING = {
             'formatter': 'simple',
         },
         'file': {
+            # Writes from a background thread in batches so that requests
+            # never wait on disk I/O; drained when the worker shuts down
             'level': 'INFO',
-            'class': 'logging.FileHandler',
+            'class': 'users.audit_log.BatchingFileHandler',
             'filename': BASE_DIR / 'logs' / 'permission_audit.log',
+            # Optional structured sink, one JSON object per line
+            'jsonl_filename': None,  # e.g. BASE_DIR / 'logs' / 'permission_audit.jsonl'
+            'batch_size': 100,  # Records written per batch
+            'flush_interval': 1.0,  # Maximum seconds a record waits before being written
             'formatter': 'verbose',
         },
     },
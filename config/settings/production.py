@@ -32,3 +32,21 @@ STATICFILES_DIRS = [os.path.join(BASE_DIR, os.environ.get('STATICFILES_DIR', 'st
 # For example, you might use a cloud storage service like AWS S3
 MEDIA_URL = os.environ.get('MEDIA_URL', '/media/')
 MEDIA_ROOT = os.path.join(BASE_DIR, os.environ.get('MEDIA_ROOT', 'media'))
+
+# Cache
+# A file-based cache is shared by all worker processes on the host, so the
+# permission cache is reused across workers
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, os.environ.get('CACHE_LOCATION', 'cache')),
+    },
+}
+
+# Permission tracking
+# Log the permission checks of a sample of the requests only; usage is counted for all
+PERMISSION_TRACKING_SAMPLE_RATE = float(os.environ.get('PERMISSION_TRACKING_SAMPLE_RATE', '0.01'))
+
+# Likes
+# Buffer like toggles and write them in batches on deployments with hot posts
+LIKE_WRITE_BEHIND = os.environ.get('LIKE_WRITE_BEHIND', 'false').lower() == 'true'
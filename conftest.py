@@ -1,5 +1,12 @@
 import pytest
 from django.contrib.auth import get_user_model
+from django.core.cache import caches
+
+@pytest.fixture(autouse=True)
+def clear_caches():
+    """Start every test with empty caches so cached data cannot leak between tests."""
+    for cache in caches.all():
+        cache.clear()
 
 @pytest.fixture
 def user_data():
@@ -16,4 +23,15 @@ def create_user(user_data):
         username=user_data['username'],
         email=user_data['email'],
         password=user_data['password']
-    )
\ No newline at end of file
+    )
+@pytest.fixture
+def create_post(create_user):
+    from community.models import Board, Category, Post
+    category = Category.objects.create(name='General')
+    board = Board.objects.create(category=category, name='Discussion')
+    return Post.objects.create(
+        title='Test post',
+        content='Test content',
+        board=board,
+        author=create_user
+    )
@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.utils.translation import gettext_lazy as _
 
-from .models import User, UserProfile, UserRole, UserRoleAssignment
+from .models import User, UserProfile, UserRole, UserRoleAssignment, PermissionUsage
 
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -47,7 +47,15 @@ class UserRoleAssignmentAdmin(admin.ModelAdmin):
     search_fields = ('user__username', 'role__name', 'assigned_by__username')
     raw_id_fields = ('user', 'role', 'assigned_by')
 
+class PermissionUsageAdmin(admin.ModelAdmin):
+    list_display = ('user', 'permission', 'granted_count', 'denied_count', 'last_used')
+    list_filter = ('permission',)
+    search_fields = ('user__username', 'permission')
+    raw_id_fields = ('user',)
+    readonly_fields = ('user', 'permission', 'granted_count', 'denied_count', 'last_used')
+
 # Register the models
 admin.site.register(User, UserAdmin)
 admin.site.register(UserRole, UserRoleAdmin)
 admin.site.register(UserRoleAssignment, UserRoleAssignmentAdmin)
+admin.site.register(PermissionUsage, PermissionUsageAdmin)
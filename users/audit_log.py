@@ -0,0 +1,143 @@
+"""
+Non-blocking logging handler for the permission audit log.
+
+The handler is configured through LOGGING in the settings like any other
+handler. Request threads only put records on a bounded in-memory queue; a
+background writer thread formats them and writes them to disk in batches.
+"""
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+_STOP = object()
+
+
+class BatchingFileHandler(logging.Handler):
+    """
+    Logging handler that writes records to files from a background thread.
+
+    Records are written in batches, flushed once ``batch_size`` records are
+    pending or ``flush_interval`` seconds have passed since the first pending
+    record. When ``jsonl_filename`` is set, each record is also written there
+    as one JSON object per line, including the ``audit`` extra if present.
+
+    If the queue is full, new records are dropped and counted in ``dropped``
+    rather than blocking the request. Closing the handler, which
+    ``logging.shutdown`` does at interpreter exit, drains the queue.
+    """
+
+    def __init__(self, filename, jsonl_filename=None, batch_size=100,
+                 flush_interval=1.0, max_queue_size=10000, encoding='utf-8'):
+        super().__init__()
+        self.filename = Path(filename)
+        self.jsonl_filename = Path(jsonl_filename) if jsonl_filename else None
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue_size = max_queue_size
+        self.encoding = encoding
+        self.dropped = 0
+        self._queue = None
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def _ensure_writer(self):
+        """
+        Start the writer thread, again in a forked worker process if needed.
+
+        Threads do not survive a fork, so a handler created before the
+        server forks its workers starts a fresh writer in each of them.
+        """
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._start_lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._queue = queue.Queue(self.max_queue_size)
+            self._thread = threading.Thread(
+                target=self._run, name='permission-audit-writer', daemon=True
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def emit(self, record):
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        """Collect records into batches and write them until stopped."""
+        stopping = False
+        while not stopping:
+            record = self._queue.get()
+            if record is _STOP:
+                self._queue.task_done()
+                break
+
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if record is _STOP:
+                    stopping = True
+                    self._queue.task_done()
+                    break
+                batch.append(record)
+
+            self._write(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _write(self, batch):
+        """Write a batch of records with one write call per file."""
+        try:
+            lines = [self.format(record) + '\n' for record in batch]
+            self._append(self.filename, ''.join(lines))
+            if self.jsonl_filename:
+                rows = [json.dumps(self._to_json(record), default=str) + '\n' for record in batch]
+                self._append(self.jsonl_filename, ''.join(rows))
+        except Exception:
+            for record in batch:
+                self.handleError(record)
+
+    def _append(self, path, text):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'a', encoding=self.encoding) as stream:
+            stream.write(text)
+
+    def _to_json(self, record):
+        """Build the structured representation of a record."""
+        data = {
+            'timestamp': datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        data.update(getattr(record, 'audit', None) or {})
+        return data
+
+    def flush(self):
+        """Block until every queued record has been written."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        """Stop the writer thread after draining the queue."""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._thread = None
+        super().close()
@@ -0,0 +1,58 @@
+"""
+Per-request authorization data of a user.
+
+An Authorization object holds a user's role names, trust level and effective
+permissions. It is built once per request by User.get_authorization() and
+shared by the permission checks of the user model, the view decorators and
+mixins, the template tags and the ``authorization`` template variable.
+"""
+from django.utils.functional import cached_property
+
+from .instrumentation import record_permission_check
+
+
+class Authorization:
+    """
+    Resolved roles, trust level and permissions of a user.
+    """
+
+    def __init__(self, role_names=(), trust_level=0, permission_mask=0,
+                 highest_role=None, is_superuser=False):
+        self.role_names = frozenset(role_names)
+        self.trust_level = trust_level
+        self.permission_mask = permission_mask
+        self.highest_role = highest_role
+        self.is_superuser = is_superuser
+
+    @cached_property
+    def permissions(self):
+        """Get the effective permissions as a {permission name: bool} dict."""
+        from .models import UserRole
+        return UserRole.mask_to_permissions(self.permission_mask)
+
+    def has_permission(self, permission_name):
+        """Check if the user has a specific permission."""
+        # Superusers have all permissions
+        granted = self.is_superuser or self.permissions.get(permission_name, False)
+        record_permission_check(permission_name, granted)
+        return granted
+
+    def has_role(self, role_name):
+        """Check if the user has a specific role."""
+        return role_name in self.role_names
+
+    def has_trust_level(self, level):
+        """Check if the user has at least the given trust level."""
+        return self.trust_level >= level
+
+
+ANONYMOUS_AUTHORIZATION = Authorization()
+
+
+def get_authorization(user):
+    """
+    Get the authorization data of a user, which may be anonymous.
+    """
+    if user is None or not user.is_authenticated:
+        return ANONYMOUS_AUTHORIZATION
+    return user.get_authorization()
@@ -0,0 +1,19 @@
+from django.utils.functional import SimpleLazyObject
+
+from .authorization import get_authorization
+
+
+def authorization(request):
+    """
+    Context processor exposing the current user's authorization data.
+
+    The data is resolved lazily, at most once per request, and shared with the
+    permission template tags.
+
+    Usage:
+    {% if 'Moderator' in authorization.role_names %}...{% endif %}
+    {% if authorization.permissions.can_edit_any_content %}...{% endif %}
+    """
+    return {
+        'authorization': SimpleLazyObject(lambda: get_authorization(getattr(request, 'user', None))),
+    }
@@ -0,0 +1,45 @@
+"""
+Removal of expired temporary role assignments.
+
+Temporary roles carry a ``valid_until`` date. Instead of filtering expired
+roles on every permission check, expired assignments are swept periodically,
+either with the ``sweep_expired_roles`` management command or in-process by
+TemporaryRoleExpiryMiddleware.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import UserRole, UserRoleAssignment
+from .signals import deferred_role_sync
+
+
+def sweep_expired_role_assignments(now=None, batch_size=500):
+    """
+    Delete the assignments of temporary roles that have expired.
+
+    Expired roles are found through the index on (is_temporary, valid_until)
+    and their assignments are deleted with one DELETE per batch. The role
+    summaries of the affected users are refreshed in the transaction of
+    each batch, so they are never left stale, and their cached permissions
+    are invalidated when it commits. Returns the number of deleted
+    assignments.
+    """
+    now = now or timezone.now()
+    expired_role_ids = list(
+        UserRole.objects.filter(is_temporary=True, valid_until__lte=now).values_list('pk', flat=True)
+    )
+    if not expired_role_ids:
+        return 0
+
+    deleted = 0
+    while True:
+        with transaction.atomic(), deferred_role_sync():
+            batch = list(
+                UserRoleAssignment.objects.filter(role_id__in=expired_role_ids)
+                .values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            count, _ = UserRoleAssignment.objects.filter(pk__in=batch).delete()
+            deleted += count
+    return deleted
@@ -0,0 +1,37 @@
+"""
+Instrumentation hook for permission checks.
+
+Authorization.has_permission() reports every check to record_permission_check().
+Checks are only collected inside a track_permission_checks() block, which
+PermissionTrackingMiddleware opens for authenticated requests; outside of
+such a block reporting a check is a single context variable lookup.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# {permission name: granted} of the checks made in the current tracking block
+_permission_checks = ContextVar('permission_checks', default=None)
+
+
+def record_permission_check(permission_name, granted):
+    """
+    Record the result of a permission check if checks are being tracked.
+    """
+    checks = _permission_checks.get()
+    if checks is not None:
+        checks[permission_name] = granted
+
+
+@contextmanager
+def track_permission_checks():
+    """
+    Collect the permission checks made inside the block.
+
+    Yields the {permission name: granted} dict the checks are recorded in.
+    """
+    checks = {}
+    token = _permission_checks.set(checks)
+    try:
+        yield checks
+    finally:
+        _permission_checks.reset(token)
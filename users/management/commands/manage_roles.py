@@ -1,12 +1,22 @@
+import csv
+import json
+import sys
+from itertools import islice
+
 from django.core.management.base import BaseCommand, CommandError
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from django.utils import timezone
 from datetime import timedelta
 
 from users.models import UserRole, UserRoleAssignment
+from users.signals import deferred_role_sync, sync_role_assignments
 
 User = get_user_model()
 
+# Rows fetched per database round trip when streaming large result sets
+ITERATOR_CHUNK_SIZE = 2000
+
 class Command(BaseCommand):
     help = 'Manage user roles and permissions'
 
@@ -19,18 +29,21 @@ class Command(BaseCommand):
         # List users with role
         list_users_parser = subparsers.add_parser('list_users', help='List users with a specific role')
         list_users_parser.add_argument('role', type=str, help='Role name')
+        self.add_format_argument(list_users_parser)
         
         # Assign role
         assign_parser = subparsers.add_parser('assign', help='Assign a role to a user')
-        assign_parser.add_argument('username', type=str, help='Username')
-        assign_parser.add_argument('role', type=str, help='Role name')
+        assign_parser.add_argument('username', type=str, nargs='?', help='Username')
+        assign_parser.add_argument('role', type=str, nargs='?', help='Role name')
         assign_parser.add_argument('--temporary', action='store_true', help='Make the role temporary')
         assign_parser.add_argument('--days', type=int, default=30, help='Number of days for temporary role')
+        self.add_bulk_arguments(assign_parser)
         
         # Remove role
         remove_parser = subparsers.add_parser('remove', help='Remove a role from a user')
-        remove_parser.add_argument('username', type=str, help='Username')
-        remove_parser.add_argument('role', type=str, help='Role name')
+        remove_parser.add_argument('username', type=str, nargs='?', help='Username')
+        remove_parser.add_argument('role', type=str, nargs='?', help='Role name')
+        self.add_bulk_arguments(remove_parser)
         
         # Create role
         create_parser = subparsers.add_parser('create_role', help='Create a new role')
@@ -54,6 +67,20 @@ class Command(BaseCommand):
         # Audit roles
         audit_parser = subparsers.add_parser('audit', help='Audit role assignments')
         audit_parser.add_argument('--days', type=int, default=30, help='Number of days to look back')
+        self.add_format_argument(audit_parser)
+
+    def add_format_argument(self, parser):
+        """Add the option selecting the output format."""
+        parser.add_argument('--format', choices=['text', 'json', 'csv'], default='text',
+                            help='Output format; json and csv are suitable for piping into other tools')
+
+    def add_bulk_arguments(self, parser):
+        """Add the options for reading (username, role) rows from a file."""
+        parser.add_argument('--file', type=str,
+                            help='CSV or JSON Lines file with "username" and "role" columns, or - for stdin')
+        parser.add_argument('--format', choices=['csv', 'jsonl'],
+                            help='Format of --file (default: from the file extension, csv for stdin)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows written per transaction')
 
     def handle(self, *args, **options):
         command = options['command']
@@ -61,7 +88,13 @@ class Command(BaseCommand):
         if command == 'list_roles':
             self.list_roles()
         elif command == 'list_users':
-            self.list_users(options['role'])
+            self.list_users(options['role'], options['format'])
+        elif command in ('assign', 'remove') and options['file']:
+            self.bulk_update_roles(command, options['file'], options['format'], options['batch_size'],
+                                   options.get('temporary', False), options.get('days', 30),
+                                   options['verbosity'])
+        elif command in ('assign', 'remove') and not (options['username'] and options['role']):
+            raise CommandError('Either a username and a role or --file is required')
         elif command == 'assign':
             self.assign_role(options['username'], options['role'], options['temporary'], options['days'])
         elif command == 'remove':
@@ -74,7 +107,7 @@ class Command(BaseCommand):
         elif command == 'delete_role':
             self.delete_role(options['name'])
         elif command == 'audit':
-            self.audit_roles(options['days'])
+            self.audit_roles(options['days'], options['format'])
         else:
             raise CommandError('Unknown command: {}'.format(command))
 
@@ -107,32 +140,75 @@ class Command(BaseCommand):
             
             self.stdout.write('')
 
-    def list_users(self, role_name):
+    def write_records(self, records, fields, output_format):
+        """
+        Stream dict records as a JSON array or as CSV rows.
+
+        Records are written one at a time, so memory use does not depend on
+        the number of records.
+        """
+        if output_format == 'csv':
+            writer = csv.DictWriter(self.stdout, fieldnames=fields, lineterminator='\n')
+            writer.writeheader()
+            for record in records:
+                writer.writerow(record)
+        else:
+            self.stdout.write('[', ending='')
+            for index, record in enumerate(records):
+                separator = ',\n' if index else '\n'
+                self.stdout.write(separator + json.dumps(record, default=str), ending='')
+            self.stdout.write('\n]')
+
+    def list_users(self, role_name, output_format='text'):
         """List all users with a specific role."""
         try:
             role = UserRole.objects.get(name=role_name)
         except UserRole.DoesNotExist:
             raise CommandError(f'Role "{role_name}" does not exist')
         
-        assignments = UserRoleAssignment.objects.filter(role=role).select_related('user')
+        assignments = (
+            UserRoleAssignment.objects.filter(role=role)
+            .select_related('user', 'assigned_by')
+            .order_by('pk')
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+        now = timezone.now()
+        expired = bool(role.is_temporary and role.valid_until and role.valid_until <= now)
+        
+        if output_format != 'text':
+            records = (
+                {
+                    'username': assignment.user.username,
+                    'email': assignment.user.email,
+                    'assigned_by': assignment.assigned_by.username if assignment.assigned_by else None,
+                    'assigned_at': assignment.assigned_at.isoformat(),
+                    'valid_until': role.valid_until.isoformat() if role.is_temporary and role.valid_until else None,
+                    'expired': expired,
+                }
+                for assignment in assignments
+            )
+            fields = ['username', 'email', 'assigned_by', 'assigned_at', 'valid_until', 'expired']
+            self.write_records(records, fields, output_format)
+            return
         
         self.stdout.write(self.style.SUCCESS(f'Users with role "{role_name}":'))
-        if assignments:
-            for assignment in assignments:
-                self.stdout.write(f'- {assignment.user.username} ({assignment.user.email})')
-                if assignment.assigned_by:
-                    self.stdout.write(f'  Assigned by: {assignment.assigned_by.username}')
-                self.stdout.write(f'  Assigned at: {assignment.assigned_at}')
-                
-                # Check if temporary
-                if role.is_temporary and role.valid_until:
-                    if role.valid_until > timezone.now():
-                        self.stdout.write(f'  Valid until: {role.valid_until}')
-                    else:
-                        self.stdout.write(self.style.WARNING(f'  Expired at: {role.valid_until}'))
-                
-                self.stdout.write('')
-        else:
+        found = False
+        for assignment in assignments:
+            found = True
+            self.stdout.write(f'- {assignment.user.username} ({assignment.user.email})')
+            if assignment.assigned_by:
+                self.stdout.write(f'  Assigned by: {assignment.assigned_by.username}')
+            self.stdout.write(f'  Assigned at: {assignment.assigned_at}')
+            
+            # Check if temporary
+            if role.is_temporary and role.valid_until:
+                if not expired:
+                    self.stdout.write(f'  Valid until: {role.valid_until}')
+                else:
+                    self.stdout.write(self.style.WARNING(f'  Expired at: {role.valid_until}'))
+            
+            self.stdout.write('')
+        if not found:
             self.stdout.write('No users found with this role')
 
     def assign_role(self, username, role_name, temporary=False, days=30):
@@ -185,6 +261,111 @@ class Command(BaseCommand):
         except UserRoleAssignment.DoesNotExist:
             self.stdout.write(self.style.WARNING(f'User "{username}" does not have role "{role_name}"'))
 
+    def read_rows(self, path, file_format):
+        """Yield (username, role name) pairs from a CSV or JSON Lines file or stdin."""
+        if file_format is None:
+            file_format = 'jsonl' if path.endswith(('.jsonl', '.ndjson')) else 'csv'
+
+        stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+        try:
+            if file_format == 'jsonl':
+                for line_number, line in enumerate(stream, 1):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        raise CommandError(f'Invalid JSON on line {line_number}')
+                    yield record.get('username'), record.get('role')
+            else:
+                for record in csv.DictReader(stream):
+                    yield record.get('username'), record.get('role')
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+    def bulk_update_roles(self, command, path, file_format=None, batch_size=1000,
+                          temporary=False, days=30, verbosity=1):
+        """
+        Assign or remove roles for many users read from a file.
+
+        Users are resolved with one query per batch and each batch is written
+        in its own transaction, with bulk_create() for assignments and one
+        DELETE per role for removals.
+        """
+        roles = {role.name: role for role in UserRole.objects.all()}
+        if command == 'assign' and temporary:
+            # Temporary roles expire as a whole, as in assign_role()
+            valid_until = timezone.now() + timedelta(days=days)
+        processed = changed = skipped = 0
+        temporary_role_ids = set()
+
+        rows = self.read_rows(path, file_format)
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+
+            usernames = {username for username, _role in batch}
+            user_ids = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+
+            pairs = set()
+            for username, role_name in batch:
+                if username not in user_ids:
+                    skipped += 1
+                    if verbosity > 1:
+                        self.stdout.write(self.style.WARNING(f'User "{username}" does not exist'))
+                elif role_name not in roles:
+                    skipped += 1
+                    if verbosity > 1:
+                        self.stdout.write(self.style.WARNING(f'Role "{role_name}" does not exist'))
+                else:
+                    pairs.add((user_ids[username], roles[role_name].id))
+
+            # The role summaries are refreshed in the same transaction as
+            # the assignments, so they cannot be left stale
+            with transaction.atomic():
+                with deferred_role_sync():
+                    if command == 'assign':
+                        existing = set(UserRoleAssignment.objects.filter(
+                            user_id__in={user_id for user_id, _role_id in pairs},
+                            role_id__in={role_id for _user_id, role_id in pairs},
+                        ).values_list('user_id', 'role_id'))
+                        new_pairs = pairs - existing
+                        UserRoleAssignment.objects.bulk_create(
+                            [UserRoleAssignment(user_id=user_id, role_id=role_id) for user_id, role_id in new_pairs],
+                            ignore_conflicts=True,
+                        )
+                        changed += len(new_pairs)
+                        temporary_role_ids.update(role_id for _user_id, role_id in pairs)
+                    else:
+                        users_by_role = {}
+                        for user_id, role_id in pairs:
+                            users_by_role.setdefault(role_id, []).append(user_id)
+                        for role_id, role_user_ids in users_by_role.items():
+                            deleted, _ = UserRoleAssignment.objects.filter(
+                                role_id=role_id, user_id__in=role_user_ids
+                            ).delete()
+                            changed += deleted
+                    if command == 'assign':
+                        # bulk_create() does not send signals
+                        sync_role_assignments({user_id for user_id, _role_id in new_pairs})
+
+            processed += len(batch)
+            self.stdout.write(f'Processed {processed} rows')
+
+        if temporary and temporary_role_ids:
+            for role in UserRole.objects.filter(pk__in=temporary_role_ids):
+                role.is_temporary = True
+                role.valid_until = valid_until
+                role.save()
+
+        verb = 'Assigned' if command == 'assign' else 'Removed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {changed} role assignments from {processed} rows ({skipped} skipped)'
+        ))
+
     def create_role(self, name, description, parent=None, permissions=None):
         """Create a new role."""
         # Check if the role already exists
@@ -282,34 +463,72 @@ class Command(BaseCommand):
         role.delete()
         self.stdout.write(self.style.SUCCESS(f'Deleted role "{name}"'))
 
-    def audit_roles(self, days=30):
+    def audit_roles(self, days=30, output_format='text'):
         """Audit role assignments."""
         # Get recent assignments
         recent_date = timezone.now() - timedelta(days=days)
-        recent_assignments = UserRoleAssignment.objects.filter(assigned_at__gte=recent_date).select_related('user', 'role', 'assigned_by')
+        recent_assignments = (
+            UserRoleAssignment.objects.filter(assigned_at__gte=recent_date)
+            .select_related('user', 'role', 'assigned_by')
+            .order_by('pk')
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+        
+        # Assignments of expired temporary roles, in a single query
+        expired_assignments = (
+            UserRoleAssignment.objects.filter(role__is_temporary=True, role__valid_until__lt=timezone.now())
+            .select_related('user', 'role')
+            .order_by('role_id', 'pk')
+            .iterator(chunk_size=ITERATOR_CHUNK_SIZE)
+        )
+        
+        if output_format != 'text':
+            def records():
+                for assignment in recent_assignments:
+                    yield {
+                        'section': 'recent',
+                        'username': assignment.user.username,
+                        'role': assignment.role.name,
+                        'assigned_by': assignment.assigned_by.username if assignment.assigned_by else None,
+                        'assigned_at': assignment.assigned_at.isoformat(),
+                        'expired_at': None,
+                    }
+                for assignment in expired_assignments:
+                    yield {
+                        'section': 'expired',
+                        'username': assignment.user.username,
+                        'role': assignment.role.name,
+                        'assigned_by': None,
+                        'assigned_at': assignment.assigned_at.isoformat(),
+                        'expired_at': assignment.role.valid_until.isoformat(),
+                    }
+            
+            fields = ['section', 'username', 'role', 'assigned_by', 'assigned_at', 'expired_at']
+            self.write_records(records(), fields, output_format)
+            return
         
         self.stdout.write(self.style.SUCCESS(f'Role assignments in the last {days} days:'))
-        if recent_assignments:
-            for assignment in recent_assignments:
-                self.stdout.write(f'- User: {assignment.user.username}')
-                self.stdout.write(f'  Role: {assignment.role.name}')
-                if assignment.assigned_by:
-                    self.stdout.write(f'  Assigned by: {assignment.assigned_by.username}')
-                self.stdout.write(f'  Assigned at: {assignment.assigned_at}')
-                self.stdout.write('')
-        else:
+        found = False
+        for assignment in recent_assignments:
+            found = True
+            self.stdout.write(f'- User: {assignment.user.username}')
+            self.stdout.write(f'  Role: {assignment.role.name}')
+            if assignment.assigned_by:
+                self.stdout.write(f'  Assigned by: {assignment.assigned_by.username}')
+            self.stdout.write(f'  Assigned at: {assignment.assigned_at}')
+            self.stdout.write('')
+        if not found:
             self.stdout.write('No recent role assignments found')
         
         # Check for expired temporary roles
-        expired_roles = UserRole.objects.filter(is_temporary=True, valid_until__lt=timezone.now())
-        if expired_roles:
-            self.stdout.write(self.style.WARNING('Expired temporary roles:'))
-            for role in expired_roles:
-                assignments = UserRoleAssignment.objects.filter(role=role).select_related('user')
-                for assignment in assignments:
-                    self.stdout.write(f'- User: {assignment.user.username}')
-                    self.stdout.write(f'  Role: {role.name}')
-                    self.stdout.write(f'  Expired at: {role.valid_until}')
-                    self.stdout.write('')
-        else:
-            self.stdout.write('No expired temporary roles found')
\ No newline at end of file
+        found = False
+        for assignment in expired_assignments:
+            if not found:
+                self.stdout.write(self.style.WARNING('Expired temporary roles:'))
+                found = True
+            self.stdout.write(f'- User: {assignment.user.username}')
+            self.stdout.write(f'  Role: {assignment.role.name}')
+            self.stdout.write(f'  Expired at: {assignment.role.valid_until}')
+            self.stdout.write('')
+        if not found:
+            self.stdout.write('No expired temporary roles found')
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from users.expiry import sweep_expired_role_assignments
+
+
+class Command(BaseCommand):
+    help = 'Remove role assignments of expired temporary roles'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help='Assignments deleted per batch')
+
+    def handle(self, *args, **options):
+        deleted = sweep_expired_role_assignments(batch_size=options['batch_size'])
+        if deleted:
+            self.stdout.write(self.style.SUCCESS(f'Removed {deleted} expired role assignments'))
+        else:
+            self.stdout.write('No expired role assignments found')
@@ -1,13 +1,107 @@
 import time
+import atexit
+import random
 import logging
+import threading
+from collections import OrderedDict
+from datetime import timedelta
 from django.utils import timezone
 from django.conf import settings
 from django.contrib import messages
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils.functional import SimpleLazyObject
 from django.utils.translation import gettext_lazy as _
 
+from . import permission_cache
+from .instrumentation import track_permission_checks
+
 # Set up logger
 logger = logging.getLogger('permission_audit')
 
+class PermissionUsageBuffer:
+    """
+    Fixed-size, per-process buffer of permission usage counters.
+
+    Counters are kept per (user id, permission) pair and written to the
+    PermissionUsage table as deltas, so several worker processes can flush
+    concurrently without losing increments. The buffer is flushed when it
+    holds ``max_entries`` pairs or ``flush_interval`` seconds have passed.
+    """
+
+    # Counters incremented per UPDATE; each one adds a term to the WHERE
+    # clause, and SQLite rejects expression trees deeper than 1000
+    update_batch_size = 250
+
+    def __init__(self, max_entries=1000, flush_interval=60):
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_flush = time.monotonic()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, user_id, permission, granted):
+        """Count one permission check."""
+        with self._lock:
+            key = (user_id, permission)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {'granted_count': 0, 'denied_count': 0, 'last_used': None}
+            if granted:
+                entry['granted_count'] += 1
+            else:
+                entry['denied_count'] += 1
+            entry['last_used'] = timezone.now()
+
+    def flush_if_due(self):
+        """Flush the buffer if it is full or the flush interval has elapsed."""
+        if (len(self._entries) >= self.max_entries or
+                time.monotonic() - self._last_flush >= self.flush_interval):
+            self.flush()
+
+    def flush(self):
+        """
+        Write the buffered counters to the database.
+
+        Missing rows are created first, then counters with the same deltas
+        are incremented together, ``update_batch_size`` rows per UPDATE.
+        """
+        from .models import PermissionUsage
+
+        with self._lock:
+            entries, self._entries = self._entries, OrderedDict()
+            self._last_flush = time.monotonic()
+        if not entries:
+            return
+
+        groups = {}
+        for (user_id, permission), entry in entries.items():
+            delta = (entry['granted_count'], entry['denied_count'])
+            groups.setdefault(delta, []).append((user_id, permission, entry['last_used']))
+
+        with transaction.atomic():
+            PermissionUsage.objects.bulk_create(
+                [
+                    PermissionUsage(user_id=user_id, permission=permission, last_used=entry['last_used'])
+                    for (user_id, permission), entry in entries.items()
+                ],
+                ignore_conflicts=True,
+            )
+            for (granted, denied), keys in groups.items():
+                for start in range(0, len(keys), self.update_batch_size):
+                    batch = keys[start:start + self.update_batch_size]
+                    condition = Q()
+                    for user_id, permission, _last_used in batch:
+                        condition |= Q(user_id=user_id, permission=permission)
+                    PermissionUsage.objects.filter(condition).update(
+                        granted_count=F('granted_count') + granted,
+                        denied_count=F('denied_count') + denied,
+                        last_used=max(last_used for _user_id, _permission, last_used in batch),
+                    )
+
 class PermissionAuditMiddleware:
     """
     Middleware to audit permission usage and enforce security policies.
@@ -21,7 +115,12 @@ class PermissionAuditMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
         # Initialize permission usage tracking
-        self.permission_usage = {}
+        self.usage_buffer = PermissionUsageBuffer(
+            max_entries=getattr(settings, 'PERMISSION_USAGE_BUFFER_SIZE', 1000),
+            flush_interval=getattr(settings, 'PERMISSION_USAGE_FLUSH_INTERVAL', 60),
+        )
+        # Write what is left when the worker exits
+        atexit.register(self.usage_buffer.flush)
         
     def __call__(self, request):
         # Process request
@@ -29,17 +128,26 @@ class PermissionAuditMiddleware:
             # Store the start time for performance monitoring
             start_time = time.time()
             
-            # Store original permissions for comparison
-            original_permissions = self._get_user_permissions(request.user) if request.user.is_authenticated else {}
+            # Permission snapshot for audit rules, resolved only on first access
+            request.original_permissions = SimpleLazyObject(
+                lambda: self._get_user_permissions(request.user)
+            )
             
             # Process the request
             response = self.get_response(request)
             
             # Check for permission usage after request processing
             if hasattr(request, 'permission_checks') and request.permission_checks:
-                self._log_permission_usage(request, request.permission_checks, start_time)
+                # Usage is counted for every request; only a sample of the
+                # requests is logged check by check
+                self._record_permission_usage(request.user, request.permission_checks)
+                if getattr(request, 'log_permission_checks', True):
+                    self._log_permission_usage(request, request.permission_checks, start_time)
                 self._check_for_unusual_activity(request, request.permission_checks)
             
+            # Persist usage statistics periodically
+            self.usage_buffer.flush_if_due()
+            
             return response
         else:
             # For unauthenticated users, just process the request
@@ -61,28 +169,23 @@ class PermissionAuditMiddleware:
             logger.info(
                 f"PERMISSION CHECK: User={user.username} ({user.id}), "
                 f"Permission={permission}, Granted={granted}, "
-                f"Path={path}, Method={method}, Time={execution_time:.4f}s"
+                f"Path={path}, Method={method}, Time={execution_time:.4f}s",
+                extra={'audit': {
+                    'event': 'permission_check',
+                    'user_id': user.id,
+                    'username': user.username,
+                    'permission': permission,
+                    'granted': granted,
+                    'path': path,
+                    'method': method,
+                    'execution_time': round(execution_time, 4),
+                }}
             )
-            
-            # Update permission usage statistics
-            if user.id not in self.permission_usage:
-                self.permission_usage[user.id] = {}
-            
-            if permission not in self.permission_usage[user.id]:
-                self.permission_usage[user.id][permission] = {
-                    'count': 0,
-                    'last_used': None,
-                    'granted_count': 0,
-                    'denied_count': 0
-                }
-            
-            self.permission_usage[user.id][permission]['count'] += 1
-            self.permission_usage[user.id][permission]['last_used'] = timezone.now()
-            
-            if granted:
-                self.permission_usage[user.id][permission]['granted_count'] += 1
-            else:
-                self.permission_usage[user.id][permission]['denied_count'] += 1
+    
+    def _record_permission_usage(self, user, permission_checks):
+        """Update permission usage statistics."""
+        for permission, granted in permission_checks.items():
+            self.usage_buffer.record(user.id, permission, granted)
     
     def _check_for_unusual_activity(self, request, permission_checks):
         """Check for unusual permission usage patterns."""
@@ -107,35 +210,24 @@ class PermissionTrackingMiddleware:
     Middleware to track permission checks during request processing.
     
     This middleware adds a permission_checks attribute to the request object
-    that can be used to track which permissions were checked during processing.
+    holding the permissions checked during processing. Every authenticated
+    request is tracked, so permission usage statistics are complete, but
+    only a sample of the requests, set by PERMISSION_TRACKING_SAMPLE_RATE,
+    is marked with log_permission_checks for logging check by check.
     """
     
     def __init__(self, get_response):
         self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PERMISSION_TRACKING_SAMPLE_RATE', 1.0)
         
     def __call__(self, request):
-        # Initialize permission tracking
-        request.permission_checks = {}
-        
-        # Monkey patch the has_permission method to track usage
-        if request.user.is_authenticated and hasattr(request.user, 'has_permission'):
-            original_has_permission = request.user.has_permission
-            
-            def tracked_has_permission(permission_name):
-                result = original_has_permission(permission_name)
-                request.permission_checks[permission_name] = result
-                return result
-            
-            request.user.has_permission = tracked_has_permission
-        
-        response = self.get_response(request)
-        
-        # Restore original method if we patched it
-        if request.user.is_authenticated and hasattr(request.user, 'has_permission'):
-            if hasattr(request.user, '_original_has_permission'):
-                request.user.has_permission = request.user._original_has_permission
+        if not request.user.is_authenticated:
+            return self.get_response(request)
         
-        return response
+        request.log_permission_checks = self.sample_rate >= 1 or random.random() < self.sample_rate
+        with track_permission_checks() as permission_checks:
+            request.permission_checks = permission_checks
+            return self.get_response(request)
 
 class LeastPrivilegeMiddleware:
     """
@@ -147,33 +239,78 @@ class LeastPrivilegeMiddleware:
     
     def __init__(self, get_response):
         self.get_response = get_response
-        self.last_review = {}
         
     def __call__(self, request):
         response = self.get_response(request)
         
         # Periodically check for unused permissions
         if request.user.is_authenticated:
-            user_id = request.user.id
-            now = timezone.now()
+            review_days = getattr(settings, 'PERMISSION_REVIEW_DAYS', 30)
             
-            # Check if it's time to review this user's permissions
-            if (user_id not in self.last_review or 
-                (now - self.last_review[user_id]).days >= getattr(settings, 'PERMISSION_REVIEW_DAYS', 30)):
-                
-                self._review_user_permissions(request.user)
-                self.last_review[user_id] = now
+            # The review marker lives in the shared cache, so reviews are
+            # coordinated across workers and survive restarts; add() only
+            # succeeds if no review happened within the review period
+            if permission_cache.get_cache().add(
+                f'permissions:last_review:{request.user.id}',
+                timezone.now(),
+                timeout=review_days * 24 * 60 * 60,
+            ):
+                self._review_user_permissions(request.user, review_days)
         
         return response
     
-    def _review_user_permissions(self, user):
+    def _review_user_permissions(self, user, review_days):
         """Review a user's permissions and log recommendations."""
-        # This would typically analyze permission usage data and make recommendations
-        # For now, we'll just log that a review was performed
+        from .models import PermissionUsage
+        
+        # Permissions granted to the user but not used during the review period
+        since = timezone.now() - timedelta(days=review_days)
+        used_permissions = set(
+            PermissionUsage.objects.filter(
+                user=user, last_used__gte=since, granted_count__gt=0
+            ).values_list('permission', flat=True)
+        )
+        granted_permissions = {name for name, granted in user.get_permissions().items() if granted}
+        unused_permissions = sorted(granted_permissions - used_permissions)
+        
         logger.info(f"PERMISSION REVIEW: Performed review for user={user.username} ({user.id})")
+        if unused_permissions:
+            logger.info(
+                f"PERMISSION REVIEW: User={user.username} ({user.id}) has not used "
+                f"{len(unused_permissions)} permissions in {review_days} days: "
+                f"{', '.join(unused_permissions)}"
+            )
+
+class TemporaryRoleExpiryMiddleware:
+    """
+    Middleware to remove expired temporary role assignments periodically.
+    
+    Every TEMPORARY_ROLE_SWEEP_INTERVAL seconds a worker tries to take a
+    short-lived marker in the shared cache; the worker that gets it runs the
+    sweep, so only one worker sweeps per interval. An interval of 0 disables
+    the in-process sweep, e.g. when the sweep_expired_roles command is
+    scheduled instead.
+    """
+    
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'TEMPORARY_ROLE_SWEEP_INTERVAL', 300)
+        self._next_check = time.monotonic() + self.interval
+        
+    def __call__(self, request):
+        response = self.get_response(request)
+        
+        if self.interval and time.monotonic() >= self._next_check:
+            self._next_check = time.monotonic() + self.interval
+            if permission_cache.get_cache().add('permissions:role_expiry_sweep', True, timeout=self.interval):
+                self._sweep()
+        
+        return response
+    
+    def _sweep(self):
+        """Remove expired assignments and log how many were removed."""
+        from .expiry import sweep_expired_role_assignments
         
-        # In a real implementation, this would:
-        # 1. Check permission usage statistics
-        # 2. Identify permissions that haven't been used in a long time
-        # 3. Log recommendations for removing unnecessary permissions
-        # 4. Potentially notify administrators
\ No newline at end of file
+        deleted = sweep_expired_role_assignments()
+        if deleted:
+            logger.info(f"ROLE EXPIRY: Removed {deleted} expired temporary role assignments")
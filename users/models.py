@@ -4,6 +4,9 @@ from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.urls import reverse
 
+from . import permission_cache
+from .authorization import Authorization
+
 class User(AbstractUser):
     """
     Custom User model extending Django's AbstractUser.
@@ -16,6 +19,11 @@ class User(AbstractUser):
     # Add additional fields as needed
     is_verified = models.BooleanField(default=False)
 
+    # Denormalized summary of the assigned roles, kept up to date by the
+    # role signals in users/signals.py
+    role_names = models.JSONField(default=list, blank=True, editable=False)
+    trust_level = models.PositiveIntegerField(default=0, editable=False)
+
     # Use email as the unique identifier for authentication
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
@@ -26,67 +34,139 @@ class User(AbstractUser):
     def get_roles(self):
         """
         Get all roles assigned to the user.
+
+        The roles are loaded once and memoized on the user instance, so every
+        later call during the same request is served without a query.
         """
-        return [assignment.role for assignment in self.role_assignments.all()]
+        if not hasattr(self, '_role_cache'):
+            self._role_cache = [
+                assignment.role
+                for assignment in self.role_assignments.select_related('role')
+            ]
+        return self._role_cache
 
     def has_role(self, role_name):
         """
         Check if the user has a specific role.
+
+        Reads the denormalized ``role_names`` field, so no query is needed.
+        """
+        return role_name in self.role_names
+
+    def get_authorization(self):
+        """
+        Get the user's resolved role names, trust level and permissions.
+
+        Role names and trust level come from the user row. The permission
+        mask is read from the shared permission cache, falling back to the
+        database on a miss. The result is memoized on the user instance;
+        since ``AuthenticationMiddleware`` loads a fresh user object per
+        request, it is effectively resolved once per request.
+        """
+        if not hasattr(self, '_authorization_cache'):
+            data = version = None
+            if self.pk:
+                # Read the version before the database, so data resolved
+                # while the user's roles change is stored under a stale key
+                version = permission_cache.get_user_version(self.pk)
+                data = permission_cache.get_user_authorization(self.pk, version)
+            if data is None:
+                data = self._build_authorization()
+                if version is not None:
+                    permission_cache.set_user_authorization(self.pk, version, data)
+            self._authorization_cache = Authorization(
+                role_names=self.role_names,
+                trust_level=self.trust_level,
+                permission_mask=data['permission_mask'],
+                highest_role=data.get('highest_role'),
+                is_superuser=self.is_superuser,
+            )
+        return self._authorization_cache
+
+    def _build_authorization(self):
+        """
+        Resolve the permission data of the user from the database.
+        """
+        roles = self.get_roles()
+        mask = 0
+        highest_role = None
+        for role in roles:
+            mask |= role.permission_mask
+            if highest_role is None or role.trust_level > highest_role.trust_level:
+                highest_role = role
+        return {
+            'permission_mask': mask,
+            'highest_role': {
+                'name': highest_role.name,
+                'description': highest_role.description,
+            } if highest_role else None,
+        }
+
+    @classmethod
+    def refresh_role_summaries(cls, user_ids, batch_size=1000):
+        """
+        Recompute the denormalized role names and trust level of users.
+
+        Returns a {user id: (role names, trust level)} dict of the new values.
         """
-        return self.role_assignments.filter(role__name=role_name).exists()
+        user_ids = list(user_ids)
+        summaries = {}
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            roles_by_user = {user_id: ([], 0) for user_id in batch}
+            assignments = UserRoleAssignment.objects.filter(user_id__in=batch).values_list(
+                'user_id', 'role__name', 'role__trust_level'
+            )
+            for user_id, role_name, trust_level in assignments:
+                names, highest = roles_by_user[user_id]
+                names.append(role_name)
+                roles_by_user[user_id] = (names, max(highest, trust_level))
+
+            # Users with the same summary are updated together, which is far
+            # cheaper than a per-row CASE expression from bulk_update()
+            users_by_summary = {}
+            for user_id, (names, trust_level) in roles_by_user.items():
+                summaries[user_id] = (sorted(names), trust_level)
+                users_by_summary.setdefault((tuple(sorted(names)), trust_level), []).append(user_id)
+            for (names, trust_level), summary_user_ids in users_by_summary.items():
+                cls.objects.filter(pk__in=summary_user_ids).update(
+                    role_names=list(names), trust_level=trust_level
+                )
+        return summaries
 
     def get_permissions(self):
         """
         Get all permissions from all roles assigned to the user.
         Takes into account role hierarchy.
+
+        Each role stores its effective permissions, ancestors included, as a
+        bitmask, so the user's permissions are the bitwise OR of the masks of
+        the assigned roles.
         """
-        permissions = {}
-        roles = self.get_roles()
+        return self.get_authorization().permissions
 
-        # Process roles to get all permissions
-        for role in roles:
-            # Get all permission fields
-            for field in role._meta.fields:
-                if field.name.startswith('can_') and isinstance(field, models.BooleanField):
-                    # If permission is not set or is False, check the value from this role
-                    if field.name not in permissions or not permissions[field.name]:
-                        permissions[field.name] = getattr(role, field.name)
-
-            # Check parent roles recursively
-            current_parent = role.parent_role
-            while current_parent:
-                for field in current_parent._meta.fields:
-                    if field.name.startswith('can_') and isinstance(field, models.BooleanField):
-                        # Only override if not already set to True
-                        if field.name not in permissions or not permissions[field.name]:
-                            permissions[field.name] = getattr(current_parent, field.name)
-                current_parent = current_parent.parent_role
-
-        return permissions
+    def clear_permission_cache(self):
+        """
+        Drop the memoized roles and permissions of this user instance.
+        """
+        for attr in ('_role_cache', '_authorization_cache'):
+            if hasattr(self, attr):
+                delattr(self, attr)
 
     def has_permission(self, permission_name):
         """
         Check if the user has a specific permission.
         Takes into account role hierarchy.
         """
-        # Superusers have all permissions
-        if self.is_superuser:
-            return True
-
-        # Get all permissions
-        permissions = self.get_permissions()
-
-        # Check if the permission exists and is True
-        return permissions.get(permission_name, False)
+        return self.get_authorization().has_permission(permission_name)
 
     def get_trust_level(self):
         """
         Get the highest trust level from all roles assigned to the user.
+
+        Reads the denormalized ``trust_level`` field, so no query is needed.
         """
-        roles = self.get_roles()
-        if not roles:
-            return 0
-        return max(role.trust_level for role in roles)
+        return self.trust_level
 
     def has_temporary_role(self):
         """
@@ -224,15 +304,120 @@ class UserRole(models.Model):
     is_temporary = models.BooleanField(default=False)
     valid_until = models.DateTimeField(null=True, blank=True)
 
+    # Effective permissions of this role and all of its ancestors, one bit
+    # per permission field (see get_permission_fields)
+    permission_mask = models.BigIntegerField(default=0, editable=False)
+
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        self.permission_mask = self.compute_permission_mask()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'permission_mask' not in update_fields:
+            kwargs['update_fields'] = list(update_fields) + ['permission_mask']
+        super().save(*args, **kwargs)
+        self._update_descendant_masks()
+
+    @classmethod
+    def get_permission_fields(cls):
+        """
+        Get the names of the permission fields in bit order.
+        """
+        return [
+            field.name for field in cls._meta.fields
+            if field.name.startswith('can_') and isinstance(field, models.BooleanField)
+        ]
+
+    @classmethod
+    def mask_to_permissions(cls, mask):
+        """
+        Expand a permission bitmask into a {permission name: bool} dict.
+        """
+        return {
+            name: bool(mask & (1 << bit))
+            for bit, name in enumerate(cls.get_permission_fields())
+        }
+
+    def get_own_permission_mask(self):
+        """
+        Get the bitmask of the permissions granted directly by this role.
+        """
+        mask = 0
+        for bit, name in enumerate(self.get_permission_fields()):
+            if getattr(self, name):
+                mask |= 1 << bit
+        return mask
+
+    def compute_permission_mask(self):
+        """
+        Compute the effective bitmask of this role.
+
+        The parent's stored mask already contains its own ancestors, so only
+        the direct parent needs to be merged.
+        """
+        mask = self.get_own_permission_mask()
+        if self.parent_role_id and self.parent_role_id != self.pk:
+            mask |= self.parent_role.permission_mask
+        return mask
+
+    def _update_descendant_masks(self, visited=None):
+        """
+        Recompute the stored masks of the roles that inherit from this one.
+        """
+        visited = visited or {self.pk}
+        for child in self.child_roles.all():
+            if child.pk in visited:
+                continue
+            visited.add(child.pk)
+            child.parent_role = self
+            mask = child.compute_permission_mask()
+            if mask != child.permission_mask:
+                child.permission_mask = mask
+                UserRole.objects.filter(pk=child.pk).update(permission_mask=mask)
+                child._update_descendant_masks(visited)
+
+    @classmethod
+    def rebuild_permission_masks(cls):
+        """
+        Recompute the stored masks of every role from scratch.
+
+        Used when the hierarchy changes without going through save(), e.g.
+        when deleting a role nulls out the parent of its children.
+        """
+        roles = cls.objects.in_bulk()
+        resolved = {}
+
+        def resolve(role, seen):
+            if role.pk in resolved:
+                return resolved[role.pk]
+            mask = role.get_own_permission_mask()
+            parent = roles.get(role.parent_role_id)
+            if parent is not None and parent.pk not in seen:
+                mask |= resolve(parent, seen | {role.pk})
+            resolved[role.pk] = mask
+            return mask
+
+        changed = []
+        for role in roles.values():
+            mask = resolve(role, set())
+            if mask != role.permission_mask:
+                role.permission_mask = mask
+                changed.append(role)
+        if changed:
+            cls.objects.bulk_update(changed, ['permission_mask'])
+        return len(changed)
+
     class Meta:
         verbose_name = _('user role')
         verbose_name_plural = _('user roles')
+        indexes = [
+            # Used by the temporary role expiry sweep
+            models.Index(fields=['is_temporary', 'valid_until'], name='userrole_expiry_idx'),
+        ]
 
 class UserRoleAssignment(models.Model):
     """
@@ -296,3 +481,30 @@ class Follow(models.Model):
         verbose_name_plural = _('follows')
         unique_together = ('follower', 'following')
         ordering = ['-created_at']
+
+
+class PermissionUsage(models.Model):
+    """
+    Aggregated permission check statistics per user and permission.
+
+    Rows are written in batches by the permission audit middleware and read by
+    least-privilege reviews, so the data is shared by all worker processes.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name='permission_usage',
+        verbose_name=_('user')
+    )
+    permission = models.CharField(_('permission'), max_length=100)
+    granted_count = models.PositiveIntegerField(_('granted count'), default=0)
+    denied_count = models.PositiveIntegerField(_('denied count'), default=0)
+    last_used = models.DateTimeField(_('last used'))
+
+    def __str__(self):
+        return f"{self.user_id} - {self.permission}"
+
+    class Meta:
+        verbose_name = _('permission usage')
+        verbose_name_plural = _('permission usage')
+        unique_together = ('user', 'permission')
@@ -0,0 +1,106 @@
+"""
+Cross-process cache of resolved user authorization data.
+
+Each user's role names, trust level and effective permission mask are stored
+in Django's cache framework so that every worker process can reuse them.
+Cache keys embed a global role version and a per-user generation: editing
+or deleting any role bumps the role version, which makes every cached user
+entry stale at once, while role assignment changes only reset the
+generation of the affected user. Both are read once, before the data is
+resolved from the database, and the entry is written under the key they
+were read into, so a resolution racing an invalidation is stored under an
+outdated key and never served.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+ROLE_VERSION_KEY = 'permissions:role_version'
+USER_GENERATION_KEY_TEMPLATE = 'permissions:user_generation:{user_id}'
+USER_KEY_TEMPLATE = 'permissions:user:{user_id}:v{version}'
+
+
+def get_cache():
+    """Get the cache backend used for authorization data."""
+    return caches[getattr(settings, 'PERMISSION_CACHE_ALIAS', 'default')]
+
+
+def get_timeout():
+    """Get the lifetime in seconds of cached user entries."""
+    return getattr(settings, 'PERMISSION_CACHE_TIMEOUT', 300)
+
+
+def get_role_version():
+    """
+    Get the current role version, initializing it if necessary.
+
+    The initial value is time based so that a version evicted from the cache
+    never resurrects entries written under an older version.
+    """
+    cache = get_cache()
+    version = cache.get(ROLE_VERSION_KEY)
+    if version is None:
+        cache.add(ROLE_VERSION_KEY, time.time_ns(), timeout=None)
+        version = cache.get(ROLE_VERSION_KEY)
+    return version
+
+
+def bump_role_version():
+    """Invalidate the cached authorization data of every user."""
+    cache = get_cache()
+    try:
+        cache.incr(ROLE_VERSION_KEY)
+    except ValueError:
+        # The version was never set or has been evicted
+        cache.set(ROLE_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def get_user_version(user_id):
+    """
+    Get the version of a user's cached entry: the role version and the
+    user's generation, initializing them if necessary.
+
+    Read it before resolving the data and pass it to both
+    get_user_authorization() and set_user_authorization().
+    """
+    cache = get_cache()
+    generation_key = USER_GENERATION_KEY_TEMPLATE.format(user_id=user_id)
+    values = cache.get_many([ROLE_VERSION_KEY, generation_key])
+    role_version = values.get(ROLE_VERSION_KEY)
+    if role_version is None:
+        role_version = get_role_version()
+    generation = values.get(generation_key)
+    if generation is None:
+        # Time based for the same reason as the role version
+        cache.add(generation_key, time.time_ns(), timeout=None)
+        generation = cache.get(generation_key)
+    return f'{role_version}.{generation}'
+
+
+def get_user_authorization(user_id, version):
+    """Get the cached authorization data of a user, or None on a miss."""
+    return get_cache().get(USER_KEY_TEMPLATE.format(user_id=user_id, version=version))
+
+
+def set_user_authorization(user_id, version, data):
+    """Store the authorization data of a user under the given version."""
+    get_cache().set(
+        USER_KEY_TEMPLATE.format(user_id=user_id, version=version), data, timeout=get_timeout()
+    )
+
+
+def invalidate_user(user_id):
+    """Invalidate the cached authorization data of a user."""
+    invalidate_users([user_id])
+
+
+def invalidate_users(user_ids):
+    """
+    Invalidate the cached authorization data of several users.
+
+    Their generations are dropped; the next lookup starts a new one.
+    """
+    get_cache().delete_many([
+        USER_GENERATION_KEY_TEMPLATE.format(user_id=user_id) for user_id in user_ids
+    ])
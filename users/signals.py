@@ -1,10 +1,52 @@
-from django.db.models.signals import post_save, post_migrate
+import threading
+from contextlib import contextmanager
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete, post_migrate
 from django.dispatch import receiver
 from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 
-from .models import UserProfile, UserRole, UserRoleAssignment
+from . import permission_cache
+from .models import User, UserProfile, UserRole, UserRoleAssignment
+
+# Users whose role assignments changed inside deferred_role_sync()
+_deferred_sync = threading.local()
+
+def sync_role_assignments(user_ids):
+    """
+    Refresh the role summaries and drop the cached authorization of users
+    whose role assignments changed outside of the per-row signals, e.g.
+    after bulk_create() or a bulk delete.
+    """
+    user_ids = list(user_ids)
+    summaries = User.refresh_role_summaries(user_ids)
+    transaction.on_commit(partial(permission_cache.invalidate_users, user_ids))
+    return summaries
+
+@contextmanager
+def deferred_role_sync():
+    """
+    Batch the work done by the role assignment signals inside the block.
+
+    Instead of refreshing each affected user as assignments are saved or
+    deleted, the users are collected and synchronized once at the end.
+    Open the block inside the transaction making the changes, so the
+    refreshed role summaries are committed together with them.
+    """
+    if getattr(_deferred_sync, 'user_ids', None) is not None:
+        # Already deferred by an outer block
+        yield
+        return
+    _deferred_sync.user_ids = set()
+    try:
+        yield
+    finally:
+        user_ids, _deferred_sync.user_ids = _deferred_sync.user_ids, None
+        if user_ids:
+            sync_role_assignments(user_ids)
 
 @receiver(post_migrate)
 def create_default_roles(sender, **kwargs):
@@ -147,6 +189,67 @@ def create_default_roles(sender, **kwargs):
             }
         )
 
+        # Bring the stored permission masks of existing roles up to date
+        UserRole.rebuild_permission_masks()
+        permission_cache.bump_role_version()
+
+        # Bring the denormalized role summaries of existing users up to date
+        User.refresh_role_summaries(User.objects.values_list('pk', flat=True))
+
+@receiver(post_delete, sender=UserRole)
+def rebuild_role_permission_masks(sender, instance, **kwargs):
+    """
+    Signal to recompute role permission masks after a role is deleted.
+
+    Deleting a role nulls the parent of its child roles with a bulk update,
+    which bypasses UserRole.save(), so the inherited bits have to be rebuilt.
+    """
+    UserRole.rebuild_permission_masks()
+
+@receiver(post_save, sender=UserRole)
+@receiver(post_delete, sender=UserRole)
+def invalidate_role_permission_cache(sender, instance, **kwargs):
+    """
+    Signal to invalidate every cached user authorization when a role changes.
+
+    The version is bumped once the change is committed; bumping earlier
+    would let another worker cache the old permissions under the new version.
+    """
+    transaction.on_commit(permission_cache.bump_role_version)
+
+@receiver(post_save, sender=UserRole)
+def refresh_role_user_summaries(sender, instance, created, **kwargs):
+    """
+    Signal to refresh the role summaries of the users holding a changed role.
+
+    A role's name or trust level is copied onto the rows of its users, so
+    editing the role has to rewrite them.
+    """
+    if not created:
+        User.refresh_role_summaries(
+            instance.user_assignments.values_list('user_id', flat=True)
+        )
+
+@receiver(post_save, sender=UserRoleAssignment)
+@receiver(post_delete, sender=UserRoleAssignment)
+def refresh_user_role_summary(sender, instance, **kwargs):
+    """
+    Signal to refresh the role summary and invalidate the cached
+    authorization of a user whose roles changed. The cached entry is
+    dropped once the change is committed.
+    """
+    deferred_user_ids = getattr(_deferred_sync, 'user_ids', None)
+    if deferred_user_ids is not None:
+        deferred_user_ids.add(instance.user_id)
+        return
+
+    summaries = User.refresh_role_summaries([instance.user_id])
+    transaction.on_commit(partial(permission_cache.invalidate_user, instance.user_id))
+    if UserRoleAssignment.user.is_cached(instance):
+        user = instance.user
+        user.role_names, user.trust_level = summaries[instance.user_id]
+        user.clear_permission_cache()
+
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_user_profile(sender, instance, created, **kwargs):
     """
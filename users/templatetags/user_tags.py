@@ -1,8 +1,13 @@
 from django import template
 from django.utils.safestring import mark_safe
 
+from users.authorization import get_authorization
+
 register = template.Library()
 
+# All tags read from the user's Authorization object, which is resolved once
+# per request, so any number of checks costs no additional queries.
+
 @register.filter
 def has_permission(user, permission_name):
     """
@@ -13,9 +18,7 @@ def has_permission(user, permission_name):
         <a href="{% url 'edit_content' %}">Edit Content</a>
     {% endif %}
     """
-    if not user.is_authenticated:
-        return False
-    return user.has_permission(permission_name)
+    return get_authorization(user).has_permission(permission_name)
 
 @register.filter
 def has_role(user, role_name):
@@ -27,9 +30,7 @@ def has_role(user, role_name):
         <a href="{% url 'admin_dashboard' %}">Admin Dashboard</a>
     {% endif %}
     """
-    if not user.is_authenticated:
-        return False
-    return user.has_role(role_name)
+    return get_authorization(user).has_role(role_name)
 
 @register.filter
 def has_trust_level(user, level):
@@ -41,13 +42,11 @@ def has_trust_level(user, level):
         <a href="{% url 'trusted_content' %}">Trusted Content</a>
     {% endif %}
     """
-    if not user.is_authenticated:
-        return False
     try:
         level = int(level)
     except (ValueError, TypeError):
         return False
-    return user.get_trust_level() >= level
+    return get_authorization(user).has_trust_level(level)
 
 @register.simple_tag
 def if_has_permission(user, permission_name, true_value, false_value=""):
@@ -57,9 +56,7 @@ def if_has_permission(user, permission_name, true_value, false_value=""):
     Usage:
     {% if_has_permission user "can_edit_any_content" "Edit" "View Only" %}
     """
-    if not user.is_authenticated:
-        return mark_safe(false_value)
-    if user.has_permission(permission_name):
+    if get_authorization(user).has_permission(permission_name):
         return mark_safe(true_value)
     return mark_safe(false_value)
 
@@ -71,9 +68,7 @@ def if_has_role(user, role_name, true_value, false_value=""):
     Usage:
     {% if_has_role user "Admin" "Admin Dashboard" "" %}
     """
-    if not user.is_authenticated:
-        return mark_safe(false_value)
-    if user.has_role(role_name):
+    if get_authorization(user).has_role(role_name):
         return mark_safe(true_value)
     return mark_safe(false_value)
 
@@ -85,13 +80,11 @@ def if_has_trust_level(user, level, true_value, false_value=""):
     Usage:
     {% if_has_trust_level user 3 "Trusted Content" "" %}
     """
-    if not user.is_authenticated:
-        return mark_safe(false_value)
     try:
         level = int(level)
     except (ValueError, TypeError):
         return mark_safe(false_value)
-    if user.get_trust_level() >= level:
+    if get_authorization(user).has_trust_level(level):
         return mark_safe(true_value)
     return mark_safe(false_value)
 
@@ -103,17 +96,8 @@ def permission_badge(user):
     Usage:
     {% permission_badge user %}
     """
-    roles = user.get_roles() if user.is_authenticated else []
-    highest_role = None
-    highest_trust_level = -1
-    
-    for role in roles:
-        if role.trust_level > highest_trust_level:
-            highest_trust_level = role.trust_level
-            highest_role = role
-    
     return {
         'user': user,
-        'highest_role': highest_role,
+        'highest_role': get_authorization(user).highest_role,
         'is_authenticated': user.is_authenticated,
-    }
\ No newline at end of file
+    }
@@ -23,3 +23,295 @@ def test_user_authentication(client, create_user, user_data):
         password=user_data['password']
     )
     assert login_successful is True
+
+# Test permission resolution is memoized per user instance
+@pytest.mark.django_db
+def test_permissions_resolved_once(create_user, django_assert_num_queries):
+    User = get_user_model()
+    user = User.objects.get(pk=create_user.pk)
+
+    # A single query loads the roles along with their precomputed masks
+    with django_assert_num_queries(1):
+        assert user.has_permission('can_create_content') is True
+
+    with django_assert_num_queries(0):
+        assert user.has_permission('can_edit_own_content') is True
+        assert user.has_role('Regular User') is True
+        assert user.get_trust_level() == 1
+
+
+# Test role permission masks follow changes to the role hierarchy
+@pytest.mark.django_db
+def test_role_permission_mask_includes_ancestors():
+    from users.models import UserRole
+    parent = UserRole.objects.create(name='Editor', can_edit_any_content=True)
+    child = UserRole.objects.create(name='Junior Editor', parent_role=parent)
+    assert UserRole.mask_to_permissions(child.permission_mask)['can_edit_any_content'] is True
+
+    parent.can_approve_content = True
+    parent.save()
+    child.refresh_from_db()
+    assert UserRole.mask_to_permissions(child.permission_mask)['can_approve_content'] is True
+
+    parent.delete()
+    child.refresh_from_db()
+    assert UserRole.mask_to_permissions(child.permission_mask)['can_edit_any_content'] is False
+
+# Test authorization data is shared through the cache and invalidated by role edits
+@pytest.mark.django_db
+def test_permission_cache_invalidated_by_role_edit(create_user, django_assert_num_queries,
+                                                  django_capture_on_commit_callbacks):
+    from users import permission_cache
+    from users.models import UserRole
+    User = get_user_model()
+    assert User.objects.get(pk=create_user.pk).has_permission('can_create_content') is True
+
+    # A fresh user object, as in a new request, is served from the cache
+    user = User.objects.get(pk=create_user.pk)
+    with django_assert_num_queries(0):
+        assert user.get_trust_level() == 1
+
+    role = UserRole.objects.get(name='Regular User')
+    role.trust_level = 2
+    version = permission_cache.get_role_version()
+    with django_capture_on_commit_callbacks(execute=True):
+        role.save()
+        # Cached entries are only invalidated once the edit is committed
+        assert permission_cache.get_role_version() == version
+    assert permission_cache.get_role_version() != version
+    assert User.objects.get(pk=create_user.pk).get_trust_level() == 2
+
+# Test authorization resolved while roles change is not served under the new version
+@pytest.mark.django_db
+@pytest.mark.parametrize('invalidate', ['bump_role_version', 'invalidate_user'])
+def test_permission_cache_race_with_invalidation(create_user, monkeypatch, invalidate):
+    from users import permission_cache
+    User = get_user_model()
+    build_authorization = User._build_authorization
+
+    def build_then_invalidate(user):
+        # The role change commits after the database was read
+        data = build_authorization(user)
+        if invalidate == 'bump_role_version':
+            permission_cache.bump_role_version()
+        else:
+            permission_cache.invalidate_user(user.pk)
+        return data
+
+    monkeypatch.setattr(User, '_build_authorization', build_then_invalidate)
+    User.objects.get(pk=create_user.pk).get_authorization()
+
+    version = permission_cache.get_user_version(create_user.pk)
+    assert permission_cache.get_user_authorization(create_user.pk, version) is None
+
+# Test the audit middleware does not resolve permissions unless a rule needs them
+@pytest.mark.django_db
+def test_audit_middleware_permission_snapshot_is_lazy(client, create_user, settings, django_assert_num_queries):
+    # The least-privilege review legitimately reads permissions on a user's first request
+    settings.MIDDLEWARE = [m for m in settings.MIDDLEWARE if m != 'users.middleware.LeastPrivilegeMiddleware']
+    client.force_login(create_user)
+    # Session, user and category queries only; no role lookup
+    with django_assert_num_queries(3):
+        response = client.get(reverse('community:category_list'))
+    assert response.status_code == 200
+
+# Test the audit log handler writes batches and drains on close
+def test_batching_audit_handler_drains_on_close(tmp_path):
+    import logging
+    from users.audit_log import BatchingFileHandler
+
+    handler = BatchingFileHandler(
+        tmp_path / 'audit.log', jsonl_filename=tmp_path / 'audit.jsonl',
+        batch_size=10, flush_interval=60
+    )
+    logger = logging.getLogger('test_permission_audit')
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        for i in range(25):
+            logger.warning('check %s', i, extra={'audit': {'permission': f'perm_{i}'}})
+    finally:
+        logger.removeHandler(handler)
+        handler.close()
+
+    assert len((tmp_path / 'audit.log').read_text().splitlines()) == 25
+    rows = (tmp_path / 'audit.jsonl').read_text().splitlines()
+    assert '"permission": "perm_24"' in rows[-1]
+
+
+# Test permission usage counters are aggregated into the PermissionUsage table
+@pytest.mark.django_db
+def test_permission_usage_buffer_flushes_deltas(create_user):
+    from users.middleware import PermissionUsageBuffer
+    from users.models import PermissionUsage
+
+    buffer = PermissionUsageBuffer(max_entries=10, flush_interval=60)
+    for granted in (True, True, False):
+        buffer.record(create_user.id, 'can_create_content', granted)
+    buffer.record(create_user.id, 'can_ban_users', False)
+    buffer.flush()
+    buffer.record(create_user.id, 'can_create_content', True)
+    buffer.flush()
+
+    assert len(buffer) == 0
+    usage = PermissionUsage.objects.get(user=create_user, permission='can_create_content')
+    assert (usage.granted_count, usage.denied_count) == (3, 1)
+    assert PermissionUsage.objects.get(user=create_user, permission='can_ban_users').denied_count == 1
+
+    # A full buffer of counters with the same delta is written in several UPDATEs
+    for i in range(1200):
+        buffer.record(create_user.id, f'permission_{i}', True)
+    buffer.flush()
+    assert PermissionUsage.objects.filter(permission__startswith='permission_', granted_count=1).count() == 1200
+
+# Test permission template tags share one preloaded authorization object
+@pytest.mark.django_db
+def test_permission_template_tags_use_preloaded_authorization(create_user, django_assert_num_queries):
+    from django.template import Context, Template
+    User = get_user_model()
+    user = User.objects.get(pk=create_user.pk)
+    template = Template(
+        '{% load user_tags %}'
+        '{% if user|has_permission:"can_create_content" %}create{% endif %}'
+        '{% if user|has_role:"Regular User" %}regular{% endif %}'
+        '{% if user|has_trust_level:3 %}trusted{% endif %}'
+        '{% if_has_permission user "can_edit_own_content" "edit" %}'
+        '{% if_has_role user "Admin" "admin" "" %}'
+        '{% permission_badge user %}'
+    )
+
+    with django_assert_num_queries(1):
+        output = template.render(Context({'user': user}))
+    assert 'create' in output and 'regular' in output and 'edit' in output
+    assert 'trusted' not in output and 'admin' not in output
+    assert 'Regular User' in output
+
+# Test role names and trust level are denormalized onto the user row
+@pytest.mark.django_db
+def test_role_summary_denormalized_on_user(create_user, django_assert_num_queries):
+    from users.models import UserRole, UserRoleAssignment
+    User = get_user_model()
+    moderator = UserRole.objects.get(name='Moderator')
+    assignment = UserRoleAssignment.objects.create(user=create_user, role=moderator)
+    assert create_user.trust_level == 3
+
+    user = User.objects.get(pk=create_user.pk)
+    with django_assert_num_queries(0):
+        assert user.get_trust_level() == 3
+        assert user.has_role('Moderator') is True
+
+    assignment.delete()
+    user = User.objects.get(pk=create_user.pk)
+    assert user.role_names == ['Regular User']
+    assert user.get_trust_level() == 1
+
+# Test the sweep removes assignments of expired temporary roles
+@pytest.mark.django_db
+def test_sweep_expired_role_assignments(create_user):
+    from datetime import timedelta
+    from django.utils import timezone
+    from users.expiry import sweep_expired_role_assignments
+    from users.models import UserRole, UserRoleAssignment
+
+    judge = UserRole.objects.create(
+        name='Contest Judge', trust_level=4, is_temporary=True,
+        valid_until=timezone.now() - timedelta(days=1)
+    )
+    UserRoleAssignment.objects.create(user=create_user, role=judge)
+    assert get_user_model().objects.get(pk=create_user.pk).get_trust_level() == 4
+
+    assert sweep_expired_role_assignments(batch_size=1) == 1
+    assert not UserRoleAssignment.objects.filter(role=judge).exists()
+    user = get_user_model().objects.get(pk=create_user.pk)
+    assert user.get_trust_level() == 1
+    assert user.has_role('Contest Judge') is False
+
+# Test manage_roles assigns and removes roles in bulk from a file
+@pytest.mark.django_db
+def test_manage_roles_bulk_assign_and_remove(tmp_path, monkeypatch):
+    from django.core.management import call_command
+    from users.models import UserRoleAssignment
+    User = get_user_model()
+    for name in ('alice', 'bob'):
+        User.objects.create_user(username=name, email=f'{name}@example.com', password='testpassword123')
+
+    csv_file = tmp_path / 'roles.csv'
+    csv_file.write_text('username,role\nalice,Moderator\nbob,Moderator\nnobody,Moderator\n')
+    call_command('manage_roles', 'assign', '--file', str(csv_file), '--batch-size', '2')
+    assert User.objects.get(username='alice').has_role('Moderator') is True
+    assert User.objects.get(username='bob').get_trust_level() == 3
+
+    jsonl_file = tmp_path / 'roles.jsonl'
+    jsonl_file.write_text('{"username": "alice", "role": "Moderator"}\n')
+    call_command('manage_roles', 'remove', '--file', str(jsonl_file))
+    assert User.objects.get(username='alice').has_role('Moderator') is False
+    assert User.objects.get(username='bob').has_role('Moderator') is True
+
+    # Assignments are not changed unless the role summaries are refreshed with them
+    def fail(cls, user_ids, batch_size=1000):
+        raise RuntimeError('refresh failed')
+    monkeypatch.setattr(User, 'refresh_role_summaries', classmethod(fail))
+    jsonl_file.write_text('{"username": "bob", "role": "Moderator"}\n')
+    with pytest.raises(RuntimeError):
+        call_command('manage_roles', 'remove', '--file', str(jsonl_file))
+    assert UserRoleAssignment.objects.filter(user__username='bob', role__name='Moderator').exists()
+
+# Test manage_roles list_users streams machine-readable output with a fixed number of queries
+@pytest.mark.django_db
+def test_manage_roles_list_users_json(django_assert_num_queries):
+    import json
+    from io import StringIO
+    from django.core.management import call_command
+    User = get_user_model()
+    admin = User.objects.create_user(username='admin', email='admin@example.com', password='testpassword123')
+    for i in range(5):
+        user = User.objects.create_user(username=f'member{i}', email=f'member{i}@example.com', password='testpassword123')
+        user.role_assignments.update(assigned_by=admin)
+
+    out = StringIO()
+    # One query for the role, one for the assignments with users and assigners
+    with django_assert_num_queries(2):
+        call_command('manage_roles', 'list_users', 'Regular User', '--format', 'json', stdout=out)
+    records = json.loads(out.getvalue())
+    assert len(records) == 6
+    assert records[-1]['assigned_by'] == 'admin'
+
+    out = StringIO()
+    call_command('manage_roles', 'audit', '--format', 'csv', stdout=out)
+    assert out.getvalue().splitlines()[0] == 'section,username,role,assigned_by,assigned_at,expired_at'
+
+# Test permission usage is counted on every request while check logs are sampled
+def test_permission_tracking_middleware_sampling(settings):
+    from unittest import mock
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from users.authorization import Authorization
+    from users.middleware import PermissionAuditMiddleware, PermissionTrackingMiddleware
+
+    def view(request):
+        Authorization(permission_mask=0).has_permission('can_ban_users')
+        return HttpResponse()
+
+    def make_request():
+        request = RequestFactory().get('/')
+        request.user = mock.Mock(is_authenticated=True, id=1)
+        return request
+
+    request = make_request()
+    settings.PERMISSION_TRACKING_SAMPLE_RATE = 1.0
+    PermissionTrackingMiddleware(view)(request)
+    assert request.permission_checks == {'can_ban_users': False}
+    assert request.log_permission_checks is True
+
+    settings.PERMISSION_TRACKING_SAMPLE_RATE = 0.5
+    # The counters are not written, so neither at exit
+    with mock.patch('users.middleware.atexit.register'):
+        audit = PermissionAuditMiddleware(PermissionTrackingMiddleware(view))
+    with mock.patch.object(audit.usage_buffer, 'flush_if_due'), \
+            mock.patch.object(audit, '_log_permission_usage') as log_permission_usage:
+        for sample in (0.9, 0.9, 0.1):
+            with mock.patch('users.middleware.random.random', return_value=sample):
+                audit(make_request())
+    # Every check is counted, but only the sampled request is logged
+    assert audit.usage_buffer._entries[(1, 'can_ban_users')]['denied_count'] == 3
+    assert log_permission_usage.call_count == 1